@@ -1,18 +1,33 @@
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from dotenv import load_dotenv
 from db import mongo,mail
-from job import create_job_offers,delete_job_offer_by_id,list_all_job_offers,get_jobs_by_user,create_job_offer_from_linkedin_url,update_job_offer_by_id,get_job_offer_by_id,search_job_offers
+from job import create_job_offers,delete_job_offer_by_id,list_all_job_offers,get_jobs_by_user,create_job_offer_from_linkedin_url,update_job_offer_by_id,get_job_offer_by_id,search_job_offers,get_job_offer_cache_stats
 from users import signup,verify_email_token,update_user_profile,sign_in_user,update_profile_image,request_reset_password_logic,reset_password_logic,get_all_users,get_user_by_id,get_role_by_id,update_user_passwords
 from flask_cors import CORS
 import json
-from flask import send_from_directory
-from cv import get_all_user_cvs, add_cv, update_user_cv, delete_user_cv, get_all_public_cvs, search_public_cvs_logic, download_cv_logic, get_cv_file_path, get_cv_path,get_cv_by_id
-from chat import extract_text_from_pdf, get_cv_chat_response, extract_text_from_pdf,analyze_cv_text, analyze_cv_text_skills
+from file_delivery import send_from_folder
+from file_store import CV_STORAGE_ROOT
+from cv import get_all_user_cvs, add_cv, update_user_cv, delete_user_cv, get_all_public_cvs, search_public_cvs_logic, download_cv_logic, get_cv_path,get_cv_by_id, get_cv_analysis
+from chat import get_cv_chat_response, stream_cv_chat_response, analyze_cv_text_skills, cv_scores, cv_profile_fields
 from apply import apply_to_job,list_applications_by_candidate,list_applications_by_job,list_all_applications
-from interview import start_interview_process,interview_sessions,handle_answer_process,get_conversation_data
-from evaluation_report import generate_candidate_report
+from interview import start_interview_process,handle_answer_process,get_conversation_data,start_interview_stream,handle_answer_stream
+from streaming import stream_sse, stream_ndjson_events
+from evaluation_report import submit_report_generation, generate_job_reports
+from indexes import ensure_indexes, check_query_plans
+from job_import import import_job_offers, iter_csv_rows, iter_ndjson_rows, JOB_IMPORT_BATCH_SIZE, JOB_IMPORT_MAX_BYTES
+from llm_cache import llm_cache
+from pdf_text import pdf_text_store
+from llm_gateway import get_llm_stats
+from token_budget import get_budget_stats
+from tasks import get_task_status, fail_stale_tasks
+from matching import get_matching_cvs_for_job, get_matching_jobs_for_cv
+from chunked_upload import init_upload, append_chunk, get_upload_status, finalize_upload, abort_upload
 from bson import ObjectId
+import io
+import click
+import logging
 
 # Load environment variables from .env
 load_dotenv()
@@ -28,13 +43,50 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config["MONGO_URI"] = os.getenv("MONGO_URI")
-
-mongo.init_app(app)
-mail.init_app(app)
+# Taille maximale d'une requête (413 au-delà) ; les gros fichiers passent par /chunked-uploads
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 25 * 1024 * 1024))
+
+initialized = False
+
+
+# Connexions et tâches de démarrage, jamais exécutées à l'import : les processus des pools (spawn)
+# réimportent app.py sous le nom __mp_main__ quand l'application est lancée avec python app.py
+# Appelé par __main__, wsgi.py et les commandes CLI (startup_tasks=False)
+def init_app(startup_tasks=True):
+    global initialized
+    if initialized:
+        return app
+    initialized = True
+    mongo.init_app(app)
+    mail.init_app(app)
+    if not startup_tasks:
+        return app
+
+    # Création des index déclarés dans indexes.py (désactivable avec ENSURE_INDEXES_ON_STARTUP=False)
+    if os.getenv('ENSURE_INDEXES_ON_STARTUP', 'True') == 'True':
+        try:
+            _, failed_indexes = ensure_indexes()
+            if failed_indexes:
+                logging.error(f"{len(failed_indexes)} index(es) could not be created: {', '.join(name for name, _ in failed_indexes)}")
+        except Exception as e:
+            logging.error(f"Could not ensure indexes: {e}")
+
+    # Tâches restées en attente ou en cours après l'arrêt de leur processus : marquées en échec
+    try:
+        stale_tasks = fail_stale_tasks()
+        if stale_tasks:
+            logging.warning(f"{stale_tasks} stale task(s) marked as failed")
+    except Exception as e:
+        logging.error(f"Could not recover stale tasks: {e}")
+    return app
 
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
-    return send_from_directory(os.getenv('UPLOAD_FOLDER'), filename)
+    # Images de profil uniquement (fichiers à la racine, noms uuid jamais réutilisés) : cache long et public
+    # Les sous-dossiers (cvs/, reports/, .spool/) ont leurs propres routes, privées
+    if "/" in filename or filename.startswith("."):
+        return jsonify({"error": "File not found"}), 404
+    return send_from_folder(os.getenv('UPLOAD_FOLDER'), filename, public=True)
 
 @app.route('/signup', methods=['POST'])
 def user_signup():
@@ -71,6 +123,47 @@ def update_profile_image_route(user_id):
     return update_profile_image(user_id, image)  # Call the function from the controller
 
 
+# Upload en plusieurs morceaux (reprise possible) : init -> PUT des morceaux -> finalize
+@app.route('/chunked-uploads', methods=['POST'])
+def chunked_upload_init():
+    response, status_code = init_upload(request.get_json(silent=True) or {})
+    return jsonify(response), status_code
+
+@app.route('/chunked-uploads/<upload_id>', methods=['PUT'])
+def chunked_upload_append(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "offset is required"}), 400
+    response, status_code = append_chunk(upload_id, offset, request.stream)
+    return jsonify(response), status_code
+
+@app.route('/chunked-uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    response, status_code = get_upload_status(upload_id)
+    return jsonify(response), status_code
+
+@app.route('/chunked-uploads/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    response, status_code = abort_upload(upload_id)
+    return jsonify(response), status_code
+
+# Le fichier reconstitué suit le même chemin qu'un upload classique
+def finalize_cv_upload(session, file):
+    fields = session["fields"]
+    return add_cv(session["user_id"], file, fields.get("title"), fields.get("expertise") or {}, fields.get("cv_txt"), fields.get("visibility", "private"))
+
+def finalize_profile_image_upload(session, file):
+    return update_profile_image(session["user_id"], file)
+
+@app.route('/chunked-uploads/<upload_id>/finalize', methods=['POST'])
+def chunked_upload_finalize(upload_id):
+    response, status_code = finalize_upload(upload_id, {
+        "cv": finalize_cv_upload,
+        "profile_image": finalize_profile_image_upload
+    })
+    return (jsonify(response) if isinstance(response, dict) else response), status_code
+
+
 @app.route('/request-reset-password', methods=['POST'])
 def request_reset_password():   
     return request_reset_password_logic()
@@ -100,9 +193,6 @@ def fetch_user(user_id):
 def fetch_role(user_id):
     return get_role_by_id(user_id)
 
-# Access the job_offers collection
-job_offers = mongo.db.job_offers
-
 
 
 @app.route('/create-job-offer', methods=['POST'])
@@ -111,6 +201,30 @@ def create_job_offer():
     return create_job_offers(job_data)
 
 
+# Import en masse : corps NDJSON (une offre par ligne) ou CSV (Content-Type: text/csv)
+@app.route('/job-offers/bulk/<user_id>', methods=['POST'])
+def bulk_import_job_offers(user_id):
+    if not ObjectId.is_valid(user_id):
+        return jsonify({"error": "Invalid user_id"}), 400
+    if not mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        return jsonify({"error": "User not found"}), 404
+
+    batch_size = max(1, request.args.get('batch_size', JOB_IMPORT_BATCH_SIZE, type=int))
+    visibility = request.args.get('visibility')
+
+    # Lecture du corps en flux, sans le charger entièrement en mémoire ; limite propre à cette route
+    request.max_content_length = JOB_IMPORT_MAX_BYTES
+    try:
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        rows = iter_csv_rows(lines) if request.mimetype == 'text/csv' else iter_ndjson_rows(lines)
+        report = import_job_offers(rows, user_id, batch_size, visibility)
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Import is larger than {JOB_IMPORT_MAX_BYTES // (1024 * 1024)} MB"}), 413
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(report), 200
+
+
 @app.route('/job-offers/<job_id>', methods=['DELETE'])
 def delete_job_offer(job_id):
     return delete_job_offer_by_id(job_id)
@@ -132,6 +246,26 @@ def update_job_offer(job_id):
     update_data = request.json
     return update_job_offer_by_id(job_id, update_data)
 
+@app.route('/job-offers/<job_id>/matching-cvs', methods=['GET'])
+def matching_cvs(job_id):
+    return get_matching_cvs_for_job(job_id, request.args.get('k', type=int))
+
+@app.route('/cvs/<cv_id>/matching-jobs', methods=['GET'])
+def matching_jobs(cv_id):
+    return get_matching_jobs_for_cv(cv_id, request.args.get('k', type=int))
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    return jsonify(get_llm_stats()), 200
+
+@app.route('/llm/budget-stats', methods=['GET'])
+def llm_budget_stats():
+    return jsonify(get_budget_stats()), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({**get_job_offer_cache_stats(), "llm": llm_cache.stats(), "pdf_text": pdf_text_store.stats()}), 200
+
 @app.route('/search-job-offers', methods=['GET'])
 def search_jobs():
     return search_job_offers()
@@ -187,7 +321,9 @@ def get_public_cvs():
 @app.route('/cvs/search', methods=['GET'])
 def search_public_cvs():
     query = request.args.get('q', '')
-    response, status_code = search_public_cvs_logic(query)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    response, status_code = search_public_cvs_logic(query, limit, offset)
     return jsonify(response), status_code
 
 
@@ -218,30 +354,34 @@ def cv_chat(cv_id):
 
     return jsonify({"answer": answer, "history": history}), 200
 
+# Variante SSE : les tokens sont envoyés dès leur génération, puis un événement "done"
+@app.route("/cv-chat/<cv_id>/stream", methods=["POST"])
+def cv_chat_stream(cv_id):
+    data = request.json
+    question = data.get("question")
+
+    if not question:
+        return jsonify({"error": "Missing 'question'"}), 400
+
+    cv = mongo.db.cvs.find_one({"_id": ObjectId(cv_id)})
+    if not cv:
+        return jsonify({"error": "CV not found"}), 404
+
+    return stream_sse(stream_cv_chat_response(cv_id, cv.get("cv_txt"), question))
+
 @app.route("/cv-analysis/<cv_id>", methods=["POST"])
 def cv_analysis(cv_id):
     if not cv_id:
         return jsonify({"error": "Missing 'cv_id'"}), 400
 
-    response, status = get_cv_file_path(cv_id)
-    if status != 200:
-        return response, status
-
-    pdf_path = r"{}".format(response.get_json()["file_path"])
-    cv_text = extract_text_from_pdf(pdf_path)
-
-    if not cv_text:
-        return jsonify({"error": "Failed to extract text from PDF"}), 500
-
-    try:
-        analysis_result = analyze_cv_text(cv_text)
-    except ValueError as e:
-        return jsonify({
-            "error": str(e),
-        }), 500
+    # Analyse précalculée à l'upload (lecture simple)
+    profile, error = get_cv_analysis(cv_id)
+    if error:
+        response, status_code = error
+        return jsonify(response), status_code
 
     return jsonify({
-        "cv_analysis": analysis_result
+        "cv_analysis": cv_scores(profile)
     }), 200
 
 @app.route('/cv-path/<cv_id>')
@@ -252,28 +392,36 @@ def get_cv_path_url(cv_id):
 def get_cv(cv_id):
     return get_cv_by_id(cv_id)
 
-@app.route('/static/uploads/cvs/<filename>')
+@app.route('/static/uploads/cvs/<path:filename>')
 def download_cv_file(filename):
-    return send_from_directory('uploads/cvs', filename)
+    return send_from_folder(CV_STORAGE_ROOT, filename)
     
 @app.route("/cv-analysis-text", methods=["POST"])
 def cv_analysis_text():
     data = request.get_json()
 
-    if not data or "cv_txt" not in data:
-        return jsonify({"error": "Missing 'cv_txt'"}), 400
-
-    cv_text = data["cv_txt"]
-
-    if not cv_text.strip():
-        return jsonify({"error": "CV text is empty"}), 400
-
-    try:
-        analysis_result = analyze_cv_text_skills(cv_text)
-    except ValueError as e:
-        return jsonify({
-            "error": str(e),
-        }), 500
+    # Avec cv_id : analyse stockée sur le CV ; sinon analyse du texte fourni (même passe, en cache)
+    if data and data.get("cv_id"):
+        profile, error = get_cv_analysis(data["cv_id"])
+        if error:
+            response, status_code = error
+            return jsonify(response), status_code
+        analysis_result = cv_profile_fields(profile)
+    else:
+        if not data or "cv_txt" not in data:
+            return jsonify({"error": "Missing 'cv_txt'"}), 400
+
+        cv_text = data["cv_txt"]
+
+        if not cv_text.strip():
+            return jsonify({"error": "CV text is empty"}), 400
+
+        try:
+            analysis_result = analyze_cv_text_skills(cv_text)
+        except ValueError as e:
+            return jsonify({
+                "error": str(e),
+            }), 500
 
     return jsonify({
         "owner": analysis_result.get("owner", ""),
@@ -302,6 +450,10 @@ def create_job_offer_from_url_route(user_id):
     response, status = create_job_offer_from_linkedin_url(user_id, job_url, visibility)
     return jsonify(response), status
     
+@app.route('/tasks/<task_id>', methods=['GET'])
+def task_status(task_id):
+    return get_task_status(task_id)
+
 @app.route('/applications/<candidate_id>', methods=['GET'])
 def get_applications_by_candidate(candidate_id):
     return list_applications_by_candidate(candidate_id)
@@ -347,6 +499,32 @@ def handle_answer():
     response, status_code = handle_answer_process(application_id, user_answer)
     return jsonify(response), status_code
 
+@app.route('/start/stream', methods=['POST'])
+def start_interview_sse():
+    data = request.json
+    application_id = data.get("application_id")
+
+    if not application_id:
+        return jsonify({"error": "Missing application_id"}), 400
+
+    events, error = start_interview_stream(application_id)
+    if error:
+        response, status_code = error
+        return jsonify(response), status_code
+    return stream_sse(events)
+
+@app.route('/answer/stream', methods=['POST'])
+def handle_answer_sse():
+    data = request.json
+    application_id = data.get("application_id")
+    user_answer = data.get("answer")
+
+    events, error = handle_answer_stream(application_id, user_answer)
+    if error:
+        response, status_code = error
+        return jsonify(response), status_code
+    return stream_sse(events)
+
 @app.route('/conversation/<application_id>', methods=['GET'])
 def get_conversation(application_id):
     response, status_code = get_conversation_data(application_id)
@@ -360,11 +538,19 @@ def generate_report_endpoint():
     if not application_id:
         return jsonify({"error": "application_id is required"}), 400
 
-    try:
-        pdf_path = generate_candidate_report(application_id)
-        return jsonify({"message": f"✅ Report successfully generated: {pdf_path}"}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    # La génération part en arrière-plan : suivre l'avancement sur /tasks/<task_id>
+    response, status_code = submit_report_generation(application_id)
+    return jsonify(response), status_code
+
+
+# Rapports de toutes les candidatures terminées d'une offre ; progression en NDJSON (une ligne par candidature)
+@app.route('/job-offers/<job_id>/reports', methods=['POST'])
+def generate_job_reports_endpoint(job_id):
+    if not ObjectId.is_valid(job_id):
+        return jsonify({"error": "Invalid job id"}), 400
+
+    force = request.args.get('force', 'false').lower() == 'true'
+    return stream_ndjson_events(generate_job_reports(job_id, force))
 
 
 @app.route('/report-path/<application_id>', methods=['GET'])
@@ -388,9 +574,64 @@ def get_report_path(application_id):
 
 @app.route('/static/uploads/reports/<filename>')
 def download_report_file(filename):
-    return send_from_directory('uploads/reports', filename)
+    # Rapport régénéré au même nom : revalidé à chaque ouverture (304 si inchangé)
+    return send_from_folder('uploads/reports', filename, immutable=False)
+
+
+# Commande CLI : flask --app app import-jobs offres.ndjson --user <user_id>
+@app.cli.command("import-jobs")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--user", "user_id", required=True, help="Id of the user creating the offers")
+@click.option("--batch-size", default=JOB_IMPORT_BATCH_SIZE, show_default=True, type=click.IntRange(min=1))
+@click.option("--visibility", type=click.Choice(["public", "private"]), help="Default visibility for rows without one")
+def import_jobs_command(path, user_id, batch_size, visibility):
+    init_app(startup_tasks=False)
+    if not ObjectId.is_valid(user_id) or not mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        raise click.BadParameter("Unknown user id", param_hint="--user")
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = iter_csv_rows(f) if path.lower().endswith('.csv') else iter_ndjson_rows(f)
+        report = import_job_offers(rows, user_id, batch_size, visibility)
+    click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+# Commande CLI : flask --app app generate-reports <job_id>
+@app.cli.command("generate-reports")
+@click.argument("job_id")
+@click.option("--force", is_flag=True, help="Regenerate reports even when they are up to date")
+def generate_reports_command(job_id, force):
+    init_app(startup_tasks=False)
+    if not ObjectId.is_valid(job_id):
+        raise click.BadParameter("Invalid job id", param_hint="job_id")
+    for event in generate_job_reports(job_id, force):
+        click.echo(json.dumps(event, ensure_ascii=False))
+
+
+# Commande CLI : flask --app app ensure-indexes
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    init_app(startup_tasks=False)
+    created, failed = ensure_indexes()
+    for name in created:
+        click.echo(f"ok  {name}")
+    for name, error in failed:
+        click.echo(f"ERR {name}: {error}", err=True)
+    if failed:
+        raise SystemExit(1)
+
+
+# Commande CLI : flask --app app check-query-plans (code de sortie 1 si un COLLSCAN est détecté)
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    init_app(startup_tasks=False)
+    try:
+        report = check_query_plans()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for entry in report:
+        click.echo(f"{entry['collection']:<14} {' > '.join(entry['stages']):<40} {entry['query']}")
 
 
 # Start the Flask app
 if __name__ == '__main__':
+    init_app()
     app.run(debug=True)
\ No newline at end of file
@@ -3,7 +3,9 @@ from datetime import datetime
 from bson import ObjectId
 from db import mongo
 from chat import extract_text_from_pdf
+from job import fetch_job_offer
 import random
+from streaming import wants_ndjson, stream_ndjson
 
 def generate_unique_code():
     for _ in range(10):  # Try up to 10 times to generate a unique code
@@ -17,7 +19,7 @@ def apply_to_job(candidate_id, job_id, cv_id):
     try:
         # Check if the candidate and CV exist
         cv = mongo.db.cvs.find_one({"_id": ObjectId(cv_id)})
-        job = mongo.db.job_offers.find_one({"_id": ObjectId(job_id)})
+        job = fetch_job_offer(job_id, cached=False) # offre peut-être supprimée depuis, dans un autre worker
         if not cv:
             return jsonify({"error": "CV not found"}), 404
 
@@ -89,6 +91,8 @@ def list_applications_by_candidate(candidate_id):
         applications_cursor = mongo.db.applications.find({
             "candidate_id": ObjectId(candidate_id)
         })
+        if wants_ndjson():
+            return stream_ndjson(applications_cursor, convert_objectid), 200
         applications = [convert_objectid(app) for app in applications_cursor]
         return jsonify(applications), 200
     except Exception as e:
@@ -98,6 +102,8 @@ def list_applications_by_candidate(candidate_id):
 def list_applications_by_job(job_id):
     try:
         applications_cursor = mongo.db.applications.find({"job_id": ObjectId(job_id)})
+        if wants_ndjson():
+            return stream_ndjson(applications_cursor, convert_objectid), 200
         applications = [convert_objectid(app) for app in applications_cursor]
         return jsonify(applications), 200
     except Exception as e:
@@ -107,6 +113,8 @@ def list_applications_by_job(job_id):
 def list_all_applications():
     try:
         applications_cursor = mongo.db.applications.find()
+        if wants_ndjson():
+            return stream_ndjson(applications_cursor, convert_objectid), 200
         applications = [convert_objectid(app) for app in applications_cursor]
         return jsonify(applications), 200
     except Exception as e:
@@ -0,0 +1,89 @@
+"""Mesure le débit des appels LLM de l'application (via llm_gateway) contre le serveur local llm_stub.py.
+
+Aucun quota consommé : lancer d'abord le stub, puis le banc avec OPENAI_BASE_URL pointant dessus.
+
+    python llm_stub.py --latency lognormal:0.8:0.5 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python benchmarks/bench_llm.py --requests 200 --concurrency 16
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import SystemMessage # noqa: E402
+import llm_gateway # noqa: E402
+import chat # noqa: E402
+import interview # noqa: E402
+import evaluation_report # noqa: E402
+
+SAMPLE_CV = (
+    "Jane Doe - Développeuse backend\n"
+    "Expérience : Acme (2 ans) - API Flask, MongoDB, Docker, CI/CD.\n"
+    "Formation : Master informatique, Université de Tunis, 2022.\n"
+    "Langues : Français (courant), Anglais (avancé).\n"
+) * 5
+SAMPLE_JOB = (
+    "Nous recherchons un développeur backend Python pour concevoir des API REST (Flask), "
+    "modéliser des données MongoDB et industrialiser les déploiements Docker.\n"
+) * 5
+SAMPLE_CONVERSATION = [
+    {"user": "", "Gpt": "Bonjour, êtes-vous prête à commencer ?"},
+    {"user": "Oui, je suis prête.", "Gpt": "Pouvez-vous vous présenter brièvement ?"},
+    {"user": "Je suis développeuse backend depuis deux ans chez Acme.", "Gpt": "Merci pour cet échange. Bonne journée et Au revoir."},
+]
+
+# Un scénario par type de prompt, avec les vraies fonctions de construction des messages
+SCENARIOS = {
+    "cv_profile": lambda: chat.run_cv_profile_analysis(SAMPLE_CV),
+    "job_extraction": lambda: chat.run_job_info_extraction(SAMPLE_JOB),
+    "interview": lambda: interview.interview_turn(
+        [SystemMessage(content=interview.generate_system_message(SAMPLE_CV, "python, flask, mongodb"))],
+        "Je suis développeuse backend depuis deux ans."
+    ),
+    "report": lambda: evaluation_report.generate_report(SAMPLE_CV, SAMPLE_CONVERSATION, SAMPLE_JOB),
+}
+
+
+def run(name, requests, concurrency):
+    scenario = SCENARIOS[name]
+    failures = 0
+
+    def call(_):
+        try:
+            scenario()
+            return True
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for ok in executor.map(call, range(requests)):
+            failures += not ok
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} n={requests:<5} concurrency={concurrency:<3} failed={failures:<4} "
+          f"elapsed={elapsed:.2f}s throughput={requests / elapsed:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel callers")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append", help="repeatable; all by default")
+    args = parser.parse_args()
+
+    if not llm_gateway.OPENAI_BASE_URL:
+        sys.exit("OPENAI_BASE_URL is not set: refusing to run against the real API")
+
+    for name in args.scenario or sorted(SCENARIOS):
+        run(name, args.requests, args.concurrency)
+
+    # Latences p50/p95, retries et erreurs par point d'appel, vues par la passerelle
+    print(json.dumps(llm_gateway.get_llm_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
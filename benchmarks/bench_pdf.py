@@ -0,0 +1,78 @@
+"""Compare l'extraction du texte des PDF : ancienne boucle page par page, extraction séquentielle et pool de processus.
+
+Les documents sont générés en mémoire (aucun fichier de test requis) pour plusieurs tailles.
+
+    python benchmarks/bench_pdf.py --pages 5 30 60 120 --runs 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz # noqa: E402
+import pdf_text # noqa: E402
+
+LINE = "Expérience : conception d'API REST en Python (Flask), modélisation MongoDB, déploiements Docker et CI/CD."
+
+
+def make_pdf(pages, lines_per_page=45):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(f"{number + 1}.{line} {LINE}" for line in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# Ancien fonctionnement de chat.extract_text_from_pdf : concaténation += page par page
+def extract_before(data):
+    doc = fitz.open(stream=data, filetype="pdf")
+    text = ""
+    for page in doc:
+        text += page.get_text()
+    doc.close()
+    return text
+
+
+def extract_sequential(data):
+    return "".join(pdf_text.iter_page_texts(data, max_pages=10 ** 6, parallel=False))
+
+
+def extract_parallel(data):
+    return "".join(pdf_text.iter_page_texts(data, max_pages=10 ** 6, parallel=True))
+
+
+def measure(func, data, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(data)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 30, 60, 120], help="document sizes to test")
+    parser.add_argument("--runs", type=int, default=3, help="runs per document (median reported)")
+    args = parser.parse_args()
+
+    pdf_text.get_process_pool().submit(int).result() # démarrage des processus payé une fois, hors mesure
+
+    print(f"{'pages':>6} {'size':>9} {'before':>9} {'sequential':>11} {'parallel':>9} {'speedup':>8}")
+    for pages in args.pages:
+        data = make_pdf(pages)
+        assert extract_before(data) == extract_parallel(data)
+        before = measure(extract_before, data, args.runs)
+        sequential = measure(extract_sequential, data, args.runs)
+        parallel = measure(extract_parallel, data, args.runs)
+        print(f"{pages:>6} {len(data) // 1024:>7}KB {before:>8.3f}s {sequential:>10.3f}s {parallel:>8.3f}s {before / parallel:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
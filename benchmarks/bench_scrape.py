@@ -0,0 +1,74 @@
+"""Compare la latence par URL du scrape LinkedIn avant/après le pool de navigateurs.
+
+Utilise des pages enregistrées (benchmarks/fixtures/*.html) : pas de réseau ni de compte LinkedIn.
+
+    python benchmarks/bench_scrape.py --runs 10
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selenium import webdriver # noqa: E402
+import scrape # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# Ancien fonctionnement : un Chrome neuf par URL et une pause fixe de 5 s (connexion exclue)
+def scrape_before(url):
+    driver = webdriver.Chrome(options=scrape.options)
+    try:
+        driver.get(url)
+        time.sleep(5)
+        scrape.extract_company_and_title(driver)
+        scrape.extract_location(driver)
+        scrape.extract_job_insights(driver)
+        scrape.extract_job_description(driver)
+    finally:
+        driver.quit()
+
+
+# Nouveau fonctionnement : navigateur du pool et attente conditionnelle
+def scrape_after(url, pool):
+    scrape.scrape_linkedin_job_details(url, pool=pool)
+
+
+def measure(label, func, urls, runs):
+    latencies = []
+    for _ in range(runs):
+        for url in urls:
+            start = time.perf_counter()
+            func(url)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<8} n={len(latencies):<4} mean={statistics.mean(latencies):.3f}s "
+          f"median={statistics.median(latencies):.3f}s p95={p95:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="passes over every fixture")
+    args = parser.parse_args()
+
+    urls = [f"file://{path}" for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html")))]
+    if not urls:
+        sys.exit(f"No fixtures found in {FIXTURES}")
+
+    measure("before", scrape_before, urls, args.runs)
+
+    pool = scrape.DriverPool(size=1, login=False) # pages locales : pas de session LinkedIn
+    try:
+        pool.release(pool.acquire()) # démarrage du navigateur payé une fois, hors mesure
+        measure("after", lambda url: scrape_after(url, pool), urls, args.runs)
+    finally:
+        pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
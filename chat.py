@@ -1,141 +1,121 @@
 
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory # Permet de garder l’historique de la conversation.
-from langchain.chains import ConversationChain # Permet de simuler une discussion fluide.
 from langchain.schema import SystemMessage, AIMessage
 from langchain.schema import HumanMessage
 import json
-import fitz # pour faire l'extraction du texte depuis pdf
+import logging
 import os
 import re
+from llm_cache import llm_cache # Cache persistant des réponses LLM
+from pdf_text import pdf_text_store # Textes des PDF adressés par SHA-256
+import llm_gateway # Point d'entrée unique des appels au modèle
+from conversation_store import conversation_store # Historique des discussions de CV (Mongo + cache borné)
+from token_budget import fit_text, TOKEN_BUDGET_CV, TOKEN_BUDGET_JOB # Textes bornés avant envoi au modèle
 from dotenv import load_dotenv # Permet de charger les clés API stockées dans un fichier .env.
 # Load environment variables from .env
 load_dotenv()
 
+# Modèles utilisés (les clients sont mutualisés par llm_gateway)
+CHAT_MODEL = "gpt-4o-mini"
+ANALYSIS_MODEL = "gpt-4o-mini"
 
+# Versions des prompts : à incrémenter à chaque modification pour invalider le cache LLM
+CV_PROFILE_PROMPT_VERSION = "cv-profile-v1"
+JOB_EXTRACTION_PROMPT_VERSION = "job-extraction-v1"
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+CV_CHAT_SYSTEM_PROMPT = (
+    "You are a helpful assistant that helps users improve their CVs based on the provided CV text. "
+    "You can only respond to questions about the CV and should politely refuse unrelated questions. "
+    "If the user asks something not related to improving the CV, respond: "
+    "'I can only provide guidance related to your CV and job search strategies. If you have questions on those topics, feel free to ask!'"
+)
 
 
-llm = ChatOpenAI(model="gpt-4o-mini", openai_api_key=OPENAI_API_KEY) # On instancie un objet ChatOpenAI avec GPT-4o (version optimisée de GPT-4).
+def cv_chat_system_content(cv_text):
+    cv_text = fit_text(cv_text, TOKEN_BUDGET_CV, "cv_chat")
+    return CV_CHAT_SYSTEM_PROMPT + f"\n\nHere is the user's CV:\n{cv_text}"
 
-# Dictionary to store separate memory per CV ID
-memory_store = {} # dictionnaire pour stocker la mémoire de chaque cv et chaque user
 
 # discusion entre IA et candidat pour ameliorer son CV
+# L'historique est lu et enregistré dans conversation_store (Mongo + cache), taille du prompt bornée
 def get_cv_chat_response(cv_id, cv_text, question):
-    # Création d’une mémoire dédiée au CV.
-    if cv_id not in memory_store:
-        memory_store[cv_id] = ConversationBufferMemory(memory_key="history", return_messages=True)
-    memory = memory_store[cv_id]
-
-    system_prompt = (
-        "You are a helpful assistant that helps users improve their CVs based on the provided CV text. "
-        "You can only respond to questions about the CV and should politely refuse unrelated questions. "
-        "If the user asks something not related to improving the CV, respond: "
-        "'I can only provide guidance related to your CV and job search strategies. If you have questions on those topics, feel free to ask!'"
-    )
-
-    conversation = ConversationChain(
-        llm=llm,
-        memory=memory,
-        verbose=False,
-    )
-
-    # Add system prompt + CV text if memory is empty
-    if not memory.buffer: #.buffer pour acceder au memoire
-        conversation.memory.chat_memory.add_message(
-            SystemMessage(content=system_prompt + f"\n\nHere is the user's CV:\n{cv_text}")
-        )
-        conversation.memory.chat_memory.add_message(
-            AIMessage(content="Thank you for sharing your CV! How can I help you improve it?")
-        )
+    state = conversation_store.load(cv_id)
+    messages = conversation_store.prompt_messages(state, cv_chat_system_content(cv_text), question)
 
     # Get response
-    answer = conversation.run(question)
-
-    # Return only human and assistant messages
-    chat_history = [
-        {"role": "user", "content": msg.content} if isinstance(msg, HumanMessage)
-        else {"role": "assistant", "content": msg.content}
-        for msg in memory.chat_memory.messages
-        if isinstance(msg, (HumanMessage, AIMessage))
-    ]
+    answer = llm_gateway.invoke(messages, model=CHAT_MODEL, endpoint="cv_chat").content
+    state = conversation_store.append(cv_id, question, answer)
 
-    return answer, chat_history
+    return answer, conversation_store.history(state)
 
 
+# Même discussion en flux : ("token", texte)... puis ("done", {"answer", "history"})
+# La question et la réponse ne sont enregistrées qu'une fois la réponse complète
+def stream_cv_chat_response(cv_id, cv_text, question):
+    state = conversation_store.load(cv_id)
+    messages = conversation_store.prompt_messages(state, cv_chat_system_content(cv_text), question)
 
+    parts = []
+    for token in llm_gateway.stream(messages, model=CHAT_MODEL, endpoint="cv_chat"):
+        parts.append(token)
+        yield "token", token
 
-def analyze_cv_text(cv_text):
-    system_prompt = (
-        "You are a helpful assistant that performs structured analysis on CVs. "
-        "Given the CV text, respond in JSON format with the following keys:\n"
-        "- skills_match (as percentage)\n"
-        "- experience_level (as percentage)\n"
-        "- education_match (as percentage)\n"
-        "- language_level (as percentage)"
-    )
+    answer = "".join(parts)
+    state = conversation_store.append(cv_id, question, answer)
+    yield "done", {"answer": answer, "history": conversation_store.history(state)}
 
-    analysis_question = (
-        "Please analyze the CV and return a JSON with the keys: "
-        "skills_match, experience_level, education_match, language_level. "
-        "Each as a percentage."
-    )
 
-    memory = ConversationBufferMemory(return_messages=True)
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 
-    conversation = ConversationChain(
-        llm=llm,
-        memory=memory,
-        verbose=False,
-    )
 
-    memory.chat_memory.add_message(SystemMessage(content=system_prompt + f"\n\nCV:\n{cv_text}"))
-    memory.chat_memory.add_message(AIMessage(content="Understood. Ready to analyze."))
+# Texte d'un PDF déjà enregistré ; le parseur n'est appelé qu'une fois par contenu (voir pdf_text.py)
+def extract_text_from_pdf(pdf_path):
+    if not pdf_path or not os.path.exists(pdf_path):
+        logging.warning(f"PDF file does not exist: {pdf_path}")
+        return None
 
-    answer = conversation.run(analysis_question)
+    try:
+        _, text = pdf_text_store.extract_file(pdf_path)
+        return text
+    except Exception as e:
+        logging.error(f"Error extracting text from {pdf_path}: {e}")
+        return None
 
-    #  Remove backticks and code block formatting if present
-    cleaned_answer = re.sub(r"```(?:json)?\n(.*?)\n```", r"\1", answer, flags=re.DOTALL).strip()
+# Clés des scores en pourcentage retournés par analyze_cv_text
+CV_SCORE_KEYS = ["skills_match", "experience_level", "education_match", "language_level"]
 
-    try:
-        analysis_json = json.loads(cleaned_answer)
-    except Exception:
-        raise ValueError(f"Could not parse analysis response:\n{answer}")
 
-    return analysis_json
+# Analyse complète d'un CV en un seul appel : scores en pourcentage + profil (compétences, expériences...)
+# Servie depuis llm_cache si déjà calculée ; CV_PROFILE_PROMPT_VERSION est stockée avec le résultat
+def analyze_cv_profile(cv_text):
+    return llm_cache.cached(
+        "cv_profile", cv_text, CV_PROFILE_PROMPT_VERSION, ANALYSIS_MODEL, 0,
+        lambda: run_cv_profile_analysis(cv_text)
+    )
 
 
-def extract_text_from_pdf(pdf_path):
-    if not os.path.exists(pdf_path):
-        print("File does not exist!")
-        return None
+# Scores en pourcentage seuls (ancienne réponse de /cv-analysis)
+def analyze_cv_text(cv_text):
+    return cv_scores(analyze_cv_profile(cv_text))
 
-    print(f"Trying to open PDF: {pdf_path}")
 
-    try:
-        doc = fitz.open(pdf_path)
-        print("PDF opened successfully.")
-        text = ""
-        for i, page in enumerate(doc): # je vais parcourir le pdf page par page pour extracter le text
-            page_text = page.get_text()
+# Profil seul (ancienne réponse de /cv-analysis-text)
+def analyze_cv_text_skills(cv_text):
+    return cv_profile_fields(analyze_cv_profile(cv_text))
 
-            text += page_text
 
+def cv_scores(profile):
+    scores = profile.get("scores", {})
+    return {key: scores.get(key) for key in CV_SCORE_KEYS}
 
 
-        print("text extracted successfully")
-        return text
+def cv_profile_fields(profile):
+    return {key: value for key, value in profile.items() if key != "scores"}
 
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
 
-def analyze_cv_text_skills(cv_text):
+def run_cv_profile_analysis(cv_text):
+    cv_text = fit_text(cv_text, TOKEN_BUDGET_CV, "cv_profile")
     system_prompt = (
-        "You are an expert that extracts owner name, technologies, skills, education, languages, snapshot, hashtags, certifications, atouts, experience, email, and phone number from text."
+        "You are an expert that extracts owner name, technologies, skills, education, languages, snapshot, hashtags, certifications, atouts, experience, email, and phone number from text, "
+        "and that scores CVs as percentages."
     )
 
     analysis_question = (
@@ -173,7 +153,13 @@ def analyze_cv_text_skills(cv_text):
       "snapshot": "",               // extrait le résumé professionnel
       "hashtags": ["#DevOps", "#Automation", ...],
       "certifications": ["AWS Certified Solutions Architect", "FinOps Cloud & AI", ...],
-      "atouts": ["Automatisation des infrastructures", "CI/CD avancé", "Leadership", ...]
+      "atouts": ["Automatisation des infrastructures", "CI/CD avancé", "Leadership", ...],
+      "scores": {
+        "skills_match": 0,           // adéquation des compétences en %
+        "experience_level": 0,       // niveau d'expérience en %
+        "education_match": 0,        // adéquation de la formation en %
+        "language_level": 0          // niveau de langue en %
+      }
     }
     
     **Base-toi uniquement sur les infos disponibles dans le CV**, et ne retourne **que du JSON** (pas de texte autour).
@@ -181,19 +167,12 @@ def analyze_cv_text_skills(cv_text):
 
     )
 
-    memory = ConversationBufferMemory(return_messages=True)
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-    conversation = ConversationChain(
-        llm=llm,
-        memory=memory,
-        verbose=False,
-    )
-
-    memory.chat_memory.add_message(SystemMessage(content=system_prompt + f"\n\nCV:\n{cv_text}. Now, {analysis_question}"))
-    memory.chat_memory.add_message(AIMessage(content="Understood. Ready to analyze."))
-
-    answer = conversation.run(analysis_question)
+    messages = [
+        SystemMessage(content=system_prompt + f"\n\nCV:\n{cv_text}. Now, {analysis_question}"),
+        AIMessage(content="Understood. Ready to analyze."),
+        HumanMessage(content=analysis_question)
+    ]
+    answer = llm_gateway.invoke(messages, model=ANALYSIS_MODEL, temperature=0, endpoint="cv_profile").content
 
     # Clean the response if it has code formatting
     cleaned_answer = re.sub(r"```(?:json)?\n(.*?)\n```", r"\1", answer, flags=re.DOTALL).strip()
@@ -206,7 +185,17 @@ def analyze_cv_text_skills(cv_text):
     return analysis_json
 
 
+# Résumé + technologies + compétences d'une offre ; les réponses en erreur ne sont pas mises en cache
 def extract_job_info_from_description(job_text):
+    return llm_cache.cached(
+        "job_extraction", job_text, JOB_EXTRACTION_PROMPT_VERSION, CHAT_MODEL, None,
+        lambda: run_job_info_extraction(job_text),
+        should_cache=lambda parsed: "error" not in parsed
+    )
+
+
+def run_job_info_extraction(job_text):
+    job_text = fit_text(job_text, TOKEN_BUDGET_JOB, "job_extraction")
     system_prompt = (
         "You are an expert HR assistant helping to extract structured information from job descriptions. "
         "Given a full job description, return the following:"
@@ -225,7 +214,7 @@ def extract_job_info_from_description(job_text):
     ]# f utiliser pour formater le format du variable qui est en {}
 
     # Run LLM without history/memory
-    response = llm.invoke(messages) # pour communiquer avec caht
+    response = llm_gateway.invoke(messages, model=CHAT_MODEL, endpoint="job_extraction") # pour communiquer avec caht
     # reponse retourne le contenue json, date d'envoie et de reception de message, tokens envoyer et token de son reponse
     # Try parsing the response as JSON
     try:
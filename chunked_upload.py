@@ -0,0 +1,205 @@
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta
+from pdf_text import PDF_MAX_BYTES
+from bson import ObjectId
+from db import mongo
+import logging
+import uuid
+import time
+import os
+
+# Fichiers en cours d'envoi ; doit être un volume partagé si plusieurs machines servent l'API
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', 'uploads/.spool')
+# Taille maximale d'un morceau (une requête) : les coupures réseau ne font perdre qu'un morceau
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', 5 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024)) # taille conseillée au client
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+PROFILE_IMAGE_MAX_BYTES = int(os.getenv('PROFILE_IMAGE_MAX_BYTES', 5 * 1024 * 1024))
+SPOOL_READ_SIZE = 64 * 1024
+# Au-delà de cette durée, un morceau resté "writing" (requête interrompue, worker arrêté) peut être renvoyé
+UPLOAD_WRITE_TIMEOUT_SECONDS = int(os.getenv('UPLOAD_WRITE_TIMEOUT_SECONDS', 300))
+
+# Types d'upload : extensions acceptées et taille maximale du fichier
+UPLOAD_KINDS = {
+    "cv": {"extensions": {".pdf"}, "max_bytes": PDF_MAX_BYTES},
+    "profile_image": {"extensions": {".png", ".jpg", ".jpeg", ".gif", ".webp"}, "max_bytes": PROFILE_IMAGE_MAX_BYTES},
+}
+
+
+def spool_path(upload_id):
+    return os.path.join(UPLOAD_SPOOL_DIR, f"{upload_id}.part")
+
+
+def session_status(session):
+    return {
+        "upload_id": session["_id"],
+        "kind": session["kind"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "received": session["received"],
+        "status": session["status"],
+        "chunk_size": UPLOAD_CHUNK_SIZE
+    }
+
+
+# Supprime les fichiers partiels abandonnés (les sessions sont purgées par l'index TTL de upload_sessions)
+def purge_stale_spool_files():
+    limit = time.time() - UPLOAD_SESSION_TTL_SECONDS
+    for name in os.listdir(UPLOAD_SPOOL_DIR):
+        path = os.path.join(UPLOAD_SPOOL_DIR, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+# Étape 1 : déclare le fichier (type, nom, taille totale) et les champs transmis à la finalisation
+def init_upload(data):
+    kind = data.get("kind")
+    user_id = data.get("user_id")
+    filename = secure_filename(data.get("filename") or "")
+    size = data.get("size")
+
+    if kind not in UPLOAD_KINDS:
+        return {"error": f"kind must be one of {sorted(UPLOAD_KINDS)}"}, 400
+    if not ObjectId.is_valid(user_id) or not mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        return {"error": "User not found"}, 404
+    if os.path.splitext(filename)[1].lower() not in UPLOAD_KINDS[kind]["extensions"]:
+        return {"error": "File type not allowed"}, 400
+    if not isinstance(size, int) or size <= 0:
+        return {"error": "size must be a positive integer"}, 400
+    if size > UPLOAD_KINDS[kind]["max_bytes"]:
+        return {"error": f"File is larger than {UPLOAD_KINDS[kind]['max_bytes'] // (1024 * 1024)} MB"}, 413
+
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    purge_stale_spool_files()
+
+    upload_id = uuid.uuid4().hex
+    open(spool_path(upload_id), "wb").close()
+    now = datetime.now()
+    session = {
+        "_id": upload_id,
+        "kind": kind,
+        "user_id": user_id,
+        "filename": filename,
+        "size": size,
+        "received": 0,
+        "status": "open",
+        "fields": data.get("fields") or {},
+        "created_at": now,
+        "updated_at": now
+    }
+    mongo.db.upload_sessions.insert_one(session)
+    return session_status(session), 201
+
+
+def get_upload_status(upload_id):
+    session = mongo.db.upload_sessions.find_one({"_id": upload_id})
+    if not session:
+        return {"error": "Upload not found"}, 404
+    return session_status(session), 200
+
+
+# Étape 2 : ajoute un morceau à la position offset (doit valoir le nombre d'octets déjà reçus)
+# Après une coupure, le client relit "received" (GET) et reprend à partir de là
+def append_chunk(upload_id, offset, stream):
+    session = mongo.db.upload_sessions.find_one({"_id": upload_id})
+    if not session:
+        return {"error": "Upload not found"}, 404
+    if offset != session["received"]:
+        return {"error": "Offset does not match received bytes", "received": session["received"]}, 409
+
+    # La position est réservée (status "writing") avant d'écrire : deux envois du même morceau ne s'écrivent pas par-dessus
+    writer = uuid.uuid4().hex
+    now = datetime.now()
+    claimed = mongo.db.upload_sessions.find_one_and_update(
+        {"_id": upload_id, "received": offset, "$or": [
+            {"status": "open"},
+            {"status": "writing", "updated_at": {"$lt": now - timedelta(seconds=UPLOAD_WRITE_TIMEOUT_SECONDS)}}
+        ]},
+        {"$set": {"status": "writing", "writer": writer, "updated_at": now}}
+    )
+    if not claimed:
+        current = mongo.db.upload_sessions.find_one({"_id": upload_id}, {"status": 1, "received": 1}) or session
+        return {"error": f"Upload is {current['status']}", "received": current["received"]}, 409
+
+    limit = min(UPLOAD_CHUNK_MAX_BYTES, session["size"] - offset)
+    written = 0
+    try:
+        # Copie par blocs : la mémoire utilisée ne dépend pas de la taille du morceau
+        with open(spool_path(upload_id), "r+b") as f:
+            f.seek(offset)
+            while True:
+                block = stream.read(SPOOL_READ_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > limit:
+                    f.truncate(offset)
+                    written = 0
+                    return {"error": "Chunk exceeds the allowed size", "received": offset, "max_chunk_bytes": limit}, 413
+                f.write(block)
+            f.truncate() # retire la fin d'un envoi précédent interrompu
+    except BaseException:
+        written = 0
+        raise
+    finally:
+        # Libère la réservation ; received n'avance que si le morceau a été écrit en entier
+        session = mongo.db.upload_sessions.find_one_and_update(
+            {"_id": upload_id, "status": "writing", "writer": writer},
+            {"$set": {"status": "open", "received": offset + written, "updated_at": datetime.now()}, "$unset": {"writer": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    if not session:
+        return {"error": "Upload changed concurrently, check its status"}, 409
+    return session_status(session), 200
+
+
+# Étape 3 : fichier complet, transmis à add_cv ou update_profile_image comme un upload classique
+# handlers : {"cv": func(session, file), "profile_image": func(session, file)} -> (réponse, code HTTP)
+def finalize_upload(upload_id, handlers):
+    session = mongo.db.upload_sessions.find_one_and_update(
+        {"_id": upload_id, "status": "open"},
+        {"$set": {"status": "finalizing", "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        existing = mongo.db.upload_sessions.find_one({"_id": upload_id}, {"status": 1})
+        if not existing:
+            return {"error": "Upload not found"}, 404
+        return {"error": f"Upload is {existing['status']}"}, 409
+
+    if session["received"] != session["size"]:
+        mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+        return {"error": "Upload incomplete", "received": session["received"], "size": session["size"]}, 409
+
+    path = spool_path(upload_id)
+    try:
+        with open(path, "rb") as f:
+            response, status = handlers[session["kind"]](session, FileStorage(stream=f, filename=session["filename"]))
+    except Exception as e:
+        logging.exception(f"Finalizing upload {upload_id} failed")
+        mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+        return {"error": str(e)}, 500
+
+    if status >= 400:
+        # Fichier refusé : la session reste ouverte, la finalisation peut être retentée
+        mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+        return response, status
+
+    os.remove(path)
+    mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "finalized", "updated_at": datetime.now()}})
+    return response, status
+
+
+def abort_upload(upload_id):
+    result = mongo.db.upload_sessions.delete_one({"_id": upload_id, "status": {"$ne": "finalizing"}})
+    if not result.deleted_count:
+        return {"error": "Upload not found"}, 404
+    if os.path.exists(spool_path(upload_id)):
+        os.remove(spool_path(upload_id))
+    return {"message": "Upload aborted"}, 200
@@ -0,0 +1,137 @@
+from langchain.schema import SystemMessage, HumanMessage, AIMessage
+from pymongo import ReturnDocument
+from datetime import datetime
+from cache import TTLCache # cache mémoire LRU/TTL des conversations actives
+from db import mongo
+import llm_gateway
+import logging
+import os
+
+# full : tout l'historique ; window : les N derniers messages ; summary : résumé des anciens + N derniers
+CV_CHAT_HISTORY_MODE = os.getenv('CV_CHAT_HISTORY_MODE', 'summary')
+CV_CHAT_WINDOW_MESSAGES = int(os.getenv('CV_CHAT_WINDOW_MESSAGES', 12))
+# Nombre maximal de messages conservés en base par conversation
+CV_CHAT_MAX_STORED_MESSAGES = int(os.getenv('CV_CHAT_MAX_STORED_MESSAGES', 200))
+CV_CHAT_SUMMARY_MODEL = "gpt-4o-mini"
+CV_CHAT_GREETING = "Thank you for sharing your CV! How can I help you improve it?"
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a candidate and a CV coach in at most 10 lines. "
+    "Keep the requested changes, the advice already given and any facts about the candidate."
+)
+
+
+# Les compteurs total/summarized sont absolus : les messages les plus anciens peuvent être
+# supprimés par $slice, offset = nombre de messages qui ne sont plus stockés
+def state_from_doc(doc):
+    messages = doc.get("messages", [])
+    return {
+        "version": doc.get("version", 0),
+        "messages": messages,
+        "summary": doc.get("summary"),
+        "summarized": doc.get("summarized", 0),
+        "offset": doc.get("total", len(messages)) - len(messages)
+    }
+
+
+# Conversations de CV : collection cv_chats (source de vérité, partagée par les workers)
+# + cache mémoire borné pour éviter de relire tout l'historique à chaque tour
+class ConversationStore:
+    def __init__(self, mode=CV_CHAT_HISTORY_MODE, window=CV_CHAT_WINDOW_MESSAGES):
+        self.mode = mode
+        self.window = window
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('CV_CHAT_CACHE_MAXSIZE', 1000)),
+            ttl=int(os.getenv('CV_CHAT_CACHE_TTL', 900))
+        )
+
+    # État de la conversation : {"version", "messages", "summary", "summarized", "offset"}
+    # La version en base est vérifiée pour ne pas servir un cache dépassé par un autre worker
+    def load(self, cv_id):
+        cv_id = str(cv_id)
+        head = mongo.db.cv_chats.find_one({"_id": cv_id}, {"version": 1})
+        if not head:
+            return {"version": 0, "messages": [], "summary": None, "summarized": 0, "offset": 0}
+
+        state = self.cache.get(cv_id)
+        if state is None or state["version"] != head.get("version"):
+            state = state_from_doc(mongo.db.cv_chats.find_one({"_id": cv_id}))
+            self.cache.set(cv_id, state)
+        return state
+
+    # Enregistre un échange question/réponse
+    def append(self, cv_id, question, answer):
+        cv_id = str(cv_id)
+        new_messages = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer}
+        ]
+        doc = mongo.db.cv_chats.find_one_and_update(
+            {"_id": cv_id},
+            {
+                "$push": {"messages": {"$each": new_messages, "$slice": -CV_CHAT_MAX_STORED_MESSAGES}},
+                "$inc": {"version": 1, "total": len(new_messages)},
+                "$set": {"updated_at": datetime.now()}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        state = state_from_doc(doc)
+        if self.mode == "summary":
+            # La réponse est déjà enregistrée : un résumé en échec sera retenté au prochain message
+            try:
+                state = self.summarize(cv_id, state)
+            except Exception as e:
+                logging.warning(f"Summarizing chat {cv_id} failed: {e}")
+        self.cache.set(cv_id, state)
+        return state
+
+    # Résume les messages sortis de la fenêtre pour que le prompt reste borné
+    def summarize(self, cv_id, state):
+        messages = state["messages"]
+        start = max(0, state["summarized"] - state["offset"])
+        cutoff = len(messages) - self.window
+        # Résumé par paquets : seulement quand une fenêtre complète est sortie
+        if cutoff - start < self.window:
+            return state
+
+        older = messages[start:cutoff]
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+        previous = f"Previous summary:\n{state['summary']}\n\n" if state.get("summary") else ""
+        summary = llm_gateway.invoke(
+            [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=previous + transcript)],
+            model=CV_CHAT_SUMMARY_MODEL, temperature=0, endpoint="cv_chat_summary"
+        ).content
+
+        summarized = state["offset"] + cutoff
+        doc = mongo.db.cv_chats.find_one_and_update(
+            {"_id": cv_id},
+            {"$set": {"summary": summary, "summarized": summarized}, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        return state_from_doc(doc)
+
+    # Messages envoyés au modèle : système + (résumé) + historique borné selon le mode + question
+    def prompt_messages(self, state, system_content, question):
+        messages = [SystemMessage(content=system_content), AIMessage(content=CV_CHAT_GREETING)]
+        history = state["messages"]
+        if self.mode == "summary":
+            if state.get("summary"):
+                messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}"))
+            # Messages non résumés : moins de deux fenêtres, voir summarize()
+            history = history[max(0, state["summarized"] - state["offset"]):]
+        elif self.mode == "window":
+            history = history[-self.window:]
+
+        for message in history:
+            message_class = HumanMessage if message["role"] == "user" else AIMessage
+            messages.append(message_class(content=message["content"]))
+        messages.append(HumanMessage(content=question))
+        return messages
+
+    # Historique affiché à l'utilisateur (message d'accueil inclus)
+    def history(self, state):
+        return [{"role": "assistant", "content": CV_CHAT_GREETING}] + state["messages"]
+
+
+conversation_store = ConversationStore()
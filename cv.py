@@ -1,11 +1,26 @@
-from flask import  jsonify,send_file #jsonify pour convertir un dictionnaire python en json # send file sert un fichier en tant que réponse HTTP.
+from flask import  jsonify #jsonify pour convertir un dictionnaire python en json # send file sert un fichier en tant que réponse HTTP.
 from werkzeug.utils import secure_filename # pour la sécurité, nettoie le nom du fichier pour éviter les noms dangereux
 from bson import ObjectId # permet de manipuler les identifiants MongoDB (_id).
 import os # utilisé ici pour gérer les chemins de fichiers.
-import uuid # pour générer des noms de fichiers uniques.
 from datetime import datetime # pour enregistrer la date et l’heure de création ou de modification.
+from streaming import wants_ndjson, stream_ndjson # réponses NDJSON en flux pour les grandes listes
+from cv_search import cv_search_index, make_snippet # index plein texte des CVs publics
+from matching import matching_engine # moteur de correspondance CV <-> offres
+from tasks import TaskQueue, QueueFull # analyse des CVs en arrière-plan
+from pdf_text import pdf_text_store, PDF_MAX_BYTES # texte extrait une fois par fichier (SHA-256)
+from file_store import cv_file_store, FileTooLarge # fichiers des CVs adressés par contenu
+from file_delivery import send_stored_file # envoi avec ETag, 304 et plages d'octets
+from chat import extract_text_from_pdf, analyze_cv_profile, CV_PROFILE_PROMPT_VERSION, ANALYSIS_MODEL
+import logging
 from db import mongo # objet qui permet d'accéder à la base de données MongoDB (défini dans db.py).
 
+# Analyse des CVs après upload, hors du worker web
+cv_analysis_queue = TaskQueue(
+    "cv_analysis",
+    max_workers=int(os.getenv('CV_ANALYSIS_WORKERS', 2)),
+    max_pending=int(os.getenv('CV_ANALYSIS_MAX_PENDING', 50))
+)
+
 def add_cv(user_id, file, title, expertise, cv_txt, visibility='private'):
 
 
@@ -23,28 +38,100 @@ def add_cv(user_id, file, title, expertise, cv_txt, visibility='private'):
     if file_extension.lower() != ".pdf":
         return {"error": "Only PDF files are allowed"}, 400
 
-    # Save file
-    unique_filename = f"{uuid.uuid4().hex}{file_extension}" # génrer un nom unique
-    upload_folder = os.getenv('', 'uploads/cvs')  # fallback folder
-    filepath = upload_folder +"/" + unique_filename # concatination du nom du fichier
+    # Save file : stockage par contenu (uploads/cvs/ab/cd/<sha256>.pdf), un fichier identique n'est gardé qu'une fois
     try:
-        file.save(filepath) # sauvegarde physique
+        file_sha256, filepath, _ = cv_file_store.store(file.stream, file_extension.lower(), max_bytes=PDF_MAX_BYTES)
+    except FileTooLarge as e:
+        return {"error": str(e)}, 413
     except Exception as e:
         return {"error": f"Failed to save file: {str(e)}"}, 500
 
-    # Insert CV record dans la base 
-    cv_data = {
-        "user_id": ObjectId(user_id),
-        "title": title,
-        "cv_txt": cv_txt,
-        "expertise": expertise,
-        "visibility": visibility,
-        "file_path": filepath,
-        "created_at": datetime.now()
+    try:
+        # Extraction du texte (ignorée si ce contenu a déjà été parsé)
+        _, pdf_text = pdf_text_store.extract_file(filepath, file_sha256)
+
+        # Insert CV record dans la base 
+        cv_data = {
+            "user_id": ObjectId(user_id),
+            "title": title,
+            "cv_txt": cv_txt or pdf_text or "",
+            "expertise": expertise,
+            "visibility": visibility,
+            "file_path": filepath,
+            "file_sha256": file_sha256,
+            "created_at": datetime.now()
+        }
+        cv_id = mongo.db.cvs.insert_one(cv_data).inserted_id
+    except Exception:
+        # Aucun CV ne référence le fichier : la référence prise par store() est rendue
+        cv_file_store.release(file_sha256)
+        raise
+    matching_engine.mark_stale()
+    cv_search_index.index_cv(cv_data)
+
+    return {"message": "CV uploaded successfully!", "cv_id": str(cv_id), "analysis_task_id": schedule_cv_analysis(cv_id)}, 201
+
+# Planifie l'analyse du CV ; si la file est pleine, elle sera faite à la première lecture
+def schedule_cv_analysis(cv_id):
+    try:
+        return cv_analysis_queue.submit("cv_analysis", run_stored_cv_analysis, str(cv_id), payload={"cv_id": str(cv_id)})
+    except QueueFull as e:
+        logging.warning(f"CV analysis for {cv_id} not queued: {e}")
+        return None
+
+# Texte analysé : celui du PDF (par empreinte, sans relire le fichier), sinon le texte envoyé avec le CV
+def cv_analysis_text(cv):
+    text = pdf_text_store.get(cv["file_sha256"]) if cv.get("file_sha256") else None
+    if text is None and cv.get("file_path"):
+        text = extract_text_from_pdf(cv["file_path"])
+    return text or cv.get("cv_txt") or ""
+
+# Analyse complète (scores + profil) stockée sur le document avec la version du prompt
+def store_cv_analysis(cv):
+    text = cv_analysis_text(cv)
+    if not text.strip():
+        raise ValueError("Failed to extract text from PDF")
+
+    analysis = {
+        "version": CV_PROFILE_PROMPT_VERSION,
+        "model": ANALYSIS_MODEL,
+        "result": analyze_cv_profile(text),
+        "analyzed_at": datetime.now()
     }
-    mongo.db.cvs.insert_one(cv_data)
+    mongo.db.cvs.update_one({"_id": cv["_id"]}, {"$set": {"analysis": analysis}})
+    return analysis
+
+# Exécuté par un worker de cv_analysis_queue
+def run_stored_cv_analysis(cv_id, report_progress):
+    cv = mongo.db.cvs.find_one({"_id": ObjectId(cv_id)}, {"file_path": 1, "file_sha256": 1, "cv_txt": 1})
+    if not cv:
+        raise ValueError("CV not found")
+    report_progress("analyzing")
+    store_cv_analysis(cv)
+    return {"cv_id": cv_id}
 
-    return {"message": "CV uploaded successfully!"}, 201
+# Analyse stockée du CV ; calculée (et stockée) ici si absente ou produite par une ancienne version du prompt
+def get_cv_analysis(cv_id):
+    if not ObjectId.is_valid(cv_id):
+        return None, ({"error": "Invalid CV ID format"}, 400)
+
+    cv = mongo.db.cvs.find_one({"_id": ObjectId(cv_id)}, {"file_path": 1, "file_sha256": 1, "cv_txt": 1, "analysis": 1})
+    if not cv:
+        return None, ({"error": "CV not found"}, 404)
+
+    analysis = cv.get("analysis")
+    if not analysis or analysis.get("version") != CV_PROFILE_PROMPT_VERSION:
+        try:
+            analysis = store_cv_analysis(cv)
+        except ValueError as e:
+            return None, ({"error": str(e)}, 500)
+    return analysis["result"], None
+
+# Convertit les IDs Mongo d'un CV en chaînes pour le JSON.
+def convert_cv_ids(cv):
+    cv["_id"] = str(cv["_id"])
+    cv["user_id"] = str(cv["user_id"])
+    return cv
 
 def get_all_user_cvs(user_id):
     # Convert user_id to ObjectId if it’s not already
@@ -52,13 +139,11 @@ def get_all_user_cvs(user_id):
 
     # Récupère tous les CVs de cet utilisateur.
     cvs_cursor = mongo.db.cvs.find({"user_id": user_id})
+    if wants_ndjson():
+        return stream_ndjson(cvs_cursor, convert_cv_ids), 200
 
     # Convert the cursor to a list of dictionaries (and convert _id to string)
-    cvs_list = []
-    for cv in cvs_cursor:
-        cv["_id"] = str(cv["_id"])
-        cv["user_id"] = str(cv["user_id"]) # Convertit les IDs Mongo en chaînes pour le JSON.
-        cvs_list.append(cv)
+    cvs_list = [convert_cv_ids(cv) for cv in cvs_cursor]
 
     return jsonify( cvs_list), 200 # Retourne la liste au format JSON.
 
@@ -84,6 +169,9 @@ def update_user_cv(user_id, cv_id, data):
     # Update only if there are changes
     if updates:
         mongo.db.cvs.update_one({"_id": cv_id}, {"$set": updates})
+        matching_engine.mark_stale()
+        if "title" in updates or "visibility" in updates:
+            cv_search_index.index_cv({**cv, **updates})
 
     return jsonify({"message": "CV updated successfully!"}), 200
 
@@ -96,9 +184,11 @@ def delete_user_cv(user_id, cv_id):
     if not cv:
         return jsonify({"error": "CV not found for this user"}), 404
 
-    # Delete the PDF file from the filesystem if it exists
+    # Delete the PDF file : fichier partagé supprimé seulement quand plus aucun CV ne le référence
+    # Les CVs enregistrés avant le stockage par contenu ont un fichier propre, supprimé directement
     pdf_file_path = cv.get("file_path")
-    if pdf_file_path and os.path.exists(pdf_file_path):
+    released = cv_file_store.release(cv["file_sha256"]) if cv.get("file_sha256") else None
+    if released is None and pdf_file_path and os.path.exists(pdf_file_path):
         try:
             os.remove(pdf_file_path)
         except Exception as e:
@@ -106,31 +196,42 @@ def delete_user_cv(user_id, cv_id):
 
     # Delete the CV document
     mongo.db.cvs.delete_one({"_id": cv_id})
+    matching_engine.mark_stale()
+    cv_search_index.remove_cv(cv_id)
 
     return jsonify({"message": "CV deleted successfully!"}), 200
 
 def get_all_public_cvs():
-    cvs = list(mongo.db.cvs.find({"visibility": "public"}))
-    for cv in cvs:
-        cv["_id"] = str(cv["_id"])
-        cv["user_id"] = str(cv["user_id"])
+    cvs_cursor = mongo.db.cvs.find({"visibility": "public"})
+    if wants_ndjson():
+        return stream_ndjson(cvs_cursor, convert_cv_ids), 200
+
+    cvs = [convert_cv_ids(cv) for cv in cvs_cursor]
     return jsonify(cvs), 200
 
 
-def search_public_cvs_logic(query):
+# Recherche classée (BM25) dans le titre et le texte des CVs publics, avec extrait
+def search_public_cvs_logic(query, limit=20, offset=0):
     if not query:
         return {"msg": "Please provide a search query"}, 400
 
-    cvs_cursor = mongo.db.cvs.find({
-        "visibility": "public",
-        "title": {"$regex": query, "$options": "i"}
-    })
+    hits = cv_search_index.search(query)[offset:offset + limit]
+    scores = {cv_id: score for cv_id, score in hits}
+
+    # Seuls les CVs de la page courante sont lus depuis Mongo
+    cvs_by_id = {
+        str(cv["_id"]): cv
+        for cv in mongo.db.cvs.find({"_id": {"$in": [ObjectId(cv_id) for cv_id in scores]}, "visibility": "public"})
+    }
 
     cvs = []
-    for cv in cvs_cursor:
-        cv["_id"] = str(cv["_id"])
-        cv["user_id"] = str(cv["user_id"])
-        cvs.append(cv)
+    for cv_id, score in hits:
+        cv = cvs_by_id.get(cv_id)
+        if not cv:
+            continue
+        cv["score"] = round(score, 4)
+        cv["snippet"] = make_snippet(cv.get("cv_txt"), query)
+        cvs.append(convert_cv_ids(cv))
 
     return cvs, 200
 
@@ -147,7 +248,9 @@ def download_cv_logic(cv_id):
         return {"error": "CV file not found"}, 404
 
     try:
-        return send_file(file_path, as_attachment=True), 200
+        # ETag = empreinte du contenu, 304 si le client a déjà le fichier, 206 pour les plages (lecteur PDF)
+        response = send_stored_file(file_path, etag=cv.get("file_sha256"), as_attachment=True)
+        return response, response.status_code
     except Exception as e:
         return {"error": f"Error sending file: {str(e)}"}, 500
 
@@ -0,0 +1,243 @@
+from db import mongo
+from collections import Counter, defaultdict
+import unicodedata
+import threading
+import tempfile
+import logging
+import json # persistance de l'index sur disque (données seules, rien n'est exécuté au chargement)
+import math
+import time
+import os
+import re
+
+# Chemin du fichier de l'index (vide = index uniquement en mémoire)
+CV_SEARCH_INDEX_PATH = os.getenv('CV_SEARCH_INDEX_PATH', '')
+# Reconstruction complète depuis Mongo après ce délai (les autres workers écrivent aussi), en arrière-plan
+CV_SEARCH_REFRESH_SECONDS = int(os.getenv('CV_SEARCH_REFRESH_SECONDS', 600))
+# Sauvegarde sur disque toutes les N mises à jour incrémentales
+CV_SEARCH_SAVE_EVERY = int(os.getenv('CV_SEARCH_SAVE_EVERY', 50))
+# Le titre compte autant que N occurrences dans le texte du CV
+TITLE_BOOST = 3
+SNIPPET_RADIUS = 80
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# Minuscules sans accents : "Développeur" -> "developpeur"
+def normalize_token(token):
+    token = unicodedata.normalize("NFKD", token.lower())
+    return "".join(c for c in token if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [normalize_token(t) for t in TOKEN_RE.findall(text or "") if len(t) > 1]
+
+
+# Index inversé BM25 : terme -> {cv_id: fréquence}
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}  # cv_id -> Counter, pour retirer un document de l'index
+        self.doc_length = {}
+        self.total_length = 0
+
+    def add(self, doc_id, tokens):
+        self.remove(doc_id)
+        terms = Counter(tokens)
+        length = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = terms
+        self.doc_length[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if not terms:
+            return
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_length.pop(doc_id)
+
+    def search(self, query_terms):
+        n_docs = len(self.doc_terms)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs or 1
+        scores = defaultdict(float)
+        for term in set(query_terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_length[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    # Fréquences par document : le reste de l'index (postings, longueurs) s'en déduit
+    def to_dict(self):
+        return {"k1": self.k1, "b": self.b, "documents": {doc_id: dict(terms) for doc_id, terms in self.doc_terms.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(data["k1"], data["b"])
+        for doc_id, terms in data["documents"].items():
+            index.add(doc_id, Counter(terms).elements())
+        return index
+
+
+# Index des CVs publics : amorcé depuis le disque ou Mongo, puis mis à jour par cv.py
+# Les reconstructions périodiques se font dans un thread ; les requêtes utilisent l'index courant en attendant
+class CVSearchIndex:
+    def __init__(self, path=CV_SEARCH_INDEX_PATH, refresh_seconds=CV_SEARCH_REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._index = None
+        self._built_at = 0
+        self._pending_saves = 0
+        self._rebuilding = False
+        self._changes = [] # mises à jour reçues pendant une reconstruction, rejouées sur le nouvel index
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def document_tokens(cv):
+        return tokenize(cv.get("title")) * TITLE_BOOST + tokenize(cv.get("cv_txt"))
+
+    # Lecture complète depuis Mongo, sans verrou
+    def build(self):
+        index = BM25Index()
+        for cv in mongo.db.cvs.find({"visibility": "public"}, {"title": 1, "cv_txt": 1}):
+            index.add(str(cv["_id"]), self.document_tokens(cv))
+        return index
+
+    def start_rebuild(self):
+        self._changes = []
+        self._rebuilding = True
+
+    def rebuild(self):
+        with self._lock:
+            if not self._rebuilding: # déjà marqué par index() pour une reconstruction en arrière-plan
+                self.start_rebuild()
+        try:
+            index = self.build()
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+                self._built_at = time.time() # nouvel essai au prochain délai
+            raise
+        with self._lock:
+            for doc_id, tokens in self._changes:
+                if tokens is None:
+                    index.remove(doc_id)
+                else:
+                    index.add(doc_id, tokens)
+            self._index = index
+            self._built_at = time.time()
+            self._rebuilding = False
+            self._changes = []
+            data = index.to_dict()
+        self.save(data)
+
+    def rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logging.warning(f"CV search index rebuild failed: {e}")
+
+    # Reprend l'index sauvegardé s'il est assez récent, sinon reconstruit
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            saved_at = os.path.getmtime(self.path)
+            if time.time() - saved_at < self.refresh_seconds:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._index = BM25Index.from_dict(json.load(f))
+                    self._built_at = saved_at
+                    return
+                except Exception as e:
+                    logging.warning(f"Could not load CV search index: {e}")
+        self.rebuild()
+
+    # data : instantané de l'index (to_dict) ; écrit dans un fichier temporaire puis remplacement atomique
+    def save(self, data=None):
+        if not self.path:
+            return
+        if data is None:
+            with self._lock:
+                if self._index is None:
+                    return
+                data = self._index.to_dict()
+                self._pending_saves = 0
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False) as f:
+            json.dump(data, f, ensure_ascii=False)
+            tmp_path = f.name
+        os.replace(tmp_path, self.path)
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self.load() # premier accès : rien à servir en attendant
+            elif time.time() - self._built_at > self.refresh_seconds and not self._rebuilding:
+                self.start_rebuild()
+                threading.Thread(target=self.rebuild_in_background, name="cv-search-rebuild", daemon=True).start()
+            return self._index
+
+    def updated(self):
+        self._pending_saves += 1
+        if self._pending_saves >= CV_SEARCH_SAVE_EVERY:
+            self._pending_saves = 0
+            data = self._index.to_dict()
+            threading.Thread(target=self.save, args=(data,), name="cv-search-save", daemon=True).start()
+
+    def apply(self, doc_id, tokens):
+        if tokens is None:
+            self._index.remove(doc_id)
+        else:
+            self._index.add(doc_id, tokens)
+        if self._rebuilding:
+            self._changes.append((doc_id, tokens))
+        self.updated()
+
+    # Ajoute ou met à jour un CV ; un CV privé est retiré de l'index
+    def index_cv(self, cv):
+        with self._lock:
+            if self._index is None:
+                return # l'amorçage lira l'état courant depuis Mongo
+            tokens = self.document_tokens(cv) if cv.get("visibility") == "public" else None
+            self.apply(str(cv["_id"]), tokens)
+
+    def remove_cv(self, cv_id):
+        with self._lock:
+            if self._index is None:
+                return
+            self.apply(str(cv_id), None)
+
+    def search(self, query):
+        index = self.index()
+        with self._lock:
+            return index.search(tokenize(query))
+
+
+cv_search_index = CVSearchIndex()
+
+
+# Extrait autour de la première occurrence d'un terme de la requête
+def make_snippet(text, query):
+    if not text:
+        return ""
+    terms = set(tokenize(query))
+    for match in TOKEN_RE.finditer(text):
+        if normalize_token(match.group()) in terms:
+            start = max(0, match.start() - SNIPPET_RADIUS)
+            end = min(len(text), match.end() + SNIPPET_RADIUS)
+            snippet = " ".join(text[start:end].split())
+            return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+    return " ".join(text[:2 * SNIPPET_RADIUS].split())
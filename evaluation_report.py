@@ -2,17 +2,35 @@ import os # Pour interagir avec les variables d'environnement
 from flask import Flask, request, jsonify # Pour créer une API web
 from dotenv import load_dotenv # Pour charger les variables d'environnement depuis un fichier .env
 from langchain.prompts import ChatPromptTemplate # Pour créer un prompt structuré pour le modèle
-from langchain_openai import ChatOpenAI  # Pour utiliser le modèle OpenAI via LangChain
+import llm_gateway # Point d'entrée unique des appels au modèle
 from db import mongo # Connexion à la base de données MongoDB
-from reportlab.lib.pagesizes import A4 # Format de page pour le PDF
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle # Styles de texte pour PDF
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer # Eléments de base pour créer le PDF
-from reportlab.lib import colors # Couleurs pour PDF
+from job import fetch_job_offer # Lecture de l'offre via le cache
+from token_budget import fit_text, fit_transcript, TOKEN_BUDGET_CV, TOKEN_BUDGET_JOB, TOKEN_BUDGET_TRANSCRIPT # Textes bornés avant envoi au modèle
+from report_pdf import generate_pdf, get_pdf_pool # Rendu PDF des rapports (importable seul par les processus du pool)
 from bson import ObjectId # Pour gérer les IDs MongoDB
+from tasks import TaskQueue, QueueFull, update_task, create_task # génération des rapports hors du worker web
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import logging
+import hashlib
+import json
 load_dotenv() # Charge les variables d'environnement depuis le fichier .env
 
-# Initialisation du modèle GPT-4o-mini avec un certain degré de créativité (temperature = 0.8)
-model = ChatOpenAI(model="gpt-4o-mini",temperature=0.8,openai_api_key=os.getenv("OPENAI_API_KEY"))
+# Modèle GPT-4o-mini avec un certain degré de créativité (temperature = 0.8)
+REPORT_MODEL = "gpt-4o-mini"
+REPORT_TEMPERATURE = 0.8
+# À incrémenter quand le prompt ou la mise en page change : force la régénération des rapports
+REPORT_VERSION = "report-v1"
+
+# Génération en lot : appels LLM en parallèle (aussi bornés par llm_gateway), rendu PDF dans le pool de report_pdf
+REPORT_BATCH_LLM_WORKERS = int(os.getenv('REPORT_BATCH_LLM_WORKERS', 4))
+
+# Génération des rapports (LLM + PDF) : nombre de rapports en parallèle et en attente bornés
+report_queue = TaskQueue(
+    "report",
+    max_workers=int(os.getenv('REPORT_WORKERS', 2)),
+    max_pending=int(os.getenv('REPORT_MAX_PENDING', 20))
+)
 
 # Fonction pour récupérer les données d'une candidature
 def fetch_application_data(application_id):
@@ -30,7 +48,7 @@ def fetch_application_data(application_id):
         raise Exception("Job ID missing in application.")
 
     # Récupère l’offre d’emploi associée à cette candidature
-    job = mongo.db.job_offers.find_one({"_id": ObjectId(job_id)})
+    job = fetch_job_offer(job_id)
     if not job:
         raise Exception("Job not found.")
 
@@ -40,9 +58,26 @@ def fetch_application_data(application_id):
     return {
         "cv_txt": cv_text,
         "conversation": conversation,
-        "job": job_description
+        "job": job_description,
+        "report_hash": application.get("report_hash"),
+        "report_path": application.get("report_path"),
+        "report_task_id": application.get("report_task_id")
     }
 
+
+# Empreinte des entrées du rapport : si elle n'a pas changé, le rapport existant est toujours valable
+def compute_report_hash(candidate_data):
+    raw = json.dumps(
+        [REPORT_VERSION, REPORT_MODEL, candidate_data["cv_txt"], candidate_data["conversation"], candidate_data["job"]],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def report_is_current(candidate_data, report_hash):
+    report_path = candidate_data.get("report_path")
+    return candidate_data.get("report_hash") == report_hash and bool(report_path) and os.path.exists(report_path)
+
 # Fonction pour générer le contenu du rapport d'entretien en texte
 def generate_report(cv_text, chat_text, offer_text):
     # Messages de consigne pour le modèle GPT
@@ -104,91 +139,187 @@ def generate_report(cv_text, chat_text, offer_text):
 	]
       
     # Crée le prompt à envoyer au modèle à partir du template et des variables
+	# CV et offre normalisés et tronqués ; la transcription garde les échanges les plus récents
+	if not isinstance(chat_text, str):
+		chat_text = fit_transcript(chat_text, TOKEN_BUDGET_TRANSCRIPT, "report")
 	prompt_template = ChatPromptTemplate.from_messages(
 		messages
 	)
 
 	prompt = prompt_template.invoke({
-		"cv_text": cv_text,
+		"cv_text": fit_text(cv_text, TOKEN_BUDGET_CV, "report"),
 		"chat_text": chat_text,
-		"offer_text": offer_text
+		"offer_text": fit_text(offer_text, TOKEN_BUDGET_JOB, "report")
 	})
       
     # Envoie le prompt au modèle et récupère la réponse
-	result = model.invoke(prompt)
+	result = llm_gateway.invoke(prompt.to_messages(), model=REPORT_MODEL, temperature=REPORT_TEMPERATURE, endpoint="report")
 	return result.content
 
 
 
-# Fonction qui génère un fichier PDF à partir du contenu texte
-def generate_pdf(content, filename):
-
-	doc = SimpleDocTemplate(str(filename), pagesize=A4,
-	                        leftMargin=30, rightMargin=30, topMargin=30, bottomMargin=30)
-
-	elements = []
-	styles = getSampleStyleSheet()
-
-	# Style pour le titre du rapport
-	title_style = ParagraphStyle(
-		'TitleStyle', parent=styles['Title'], fontSize=14, spaceAfter=10, alignment=1
-	)
-
-	# Style pour le texte normal
-	normal_style = ParagraphStyle(
-		'NormalStyle', parent=styles['Normal'], fontSize=10, leading=14, spaceAfter=6
-	)
+# Fonction principale pour générer un rapport PDF pour une candidature
+# Retourne {"report_path", "regenerated"} ; rien n'est refait si les entrées n'ont pas changé
+def generate_candidate_report(application_id, report_progress=lambda progress: None):
 
-	# Titre du rapport
-	elements.append(Paragraph("📄 **Rapport d’Entretien**", title_style))
-	elements.append(Spacer(1, 10))
+    # Étape 1 : Récupération des données
+    candidate_data = fetch_application_data(application_id)
+    report_hash = compute_report_hash(candidate_data)
+    if report_is_current(candidate_data, report_hash):
+        return {"report_path": candidate_data["report_path"], "regenerated": False}
 
-	# Ajout de chaque paragraphe du contenu
-	for paragraph in content.split("\n"):
-		if paragraph.strip():
-			elements.append(Paragraph(paragraph, normal_style))
-			elements.append(Spacer(1, 4))
+    # Étape 2 : Génération du rapport avec GPT
+    report_progress("generating")
+    report_content = generate_report(candidate_data['cv_txt'], candidate_data['conversation'], candidate_data['job'])
 
-    # Fonction pour ajouter un pied de page avec numéro
-	def footer(canvas, doc):
-		canvas.setFont("Helvetica", 8)
-		canvas.setFillColor(colors.grey)
-		canvas.drawString(30, 20, f"Page {doc.page}/2")  # Max 2 pages
+    # Étape 3 : Définir le chemin du fichier PDF à générer
+    pdf_path = report_pdf_path(application_id)
 
-	doc.build(elements, onLaterPages=footer, onFirstPage=footer)
+    # Étape 4 : Générer le PDF
+    report_progress("rendering")
+    generate_pdf(report_content, pdf_path)
 
+    # Étape 5 : Enregistrer le chemin et l'empreinte du rapport dans la base de données
+    save_report(application_id, pdf_path, report_hash)
 
-# Fonction principale pour générer un rapport PDF pour une candidature
-def generate_candidate_report(application_id):
-    
-    # Étape 1 : Récupération des données
-    
-    candidate_data = fetch_application_data(application_id)
-    cv_text = candidate_data['cv_txt']
-    chat_text = candidate_data['conversation']
-    offer_text = candidate_data['job']
+    return {"report_path": pdf_path, "regenerated": True}
 
-	# Étape 2 : Génération du rapport avec GPT
 
-    report_content = generate_report(cv_text, chat_text, offer_text)
-    
-	# Étape 3 : Définir le chemin du fichier PDF à générer
-      
+def report_pdf_path(application_id):
     upload_folder = os.getenv('', 'uploads/reports')  # Chemin de sauvegarde
-    pdf_path = upload_folder +"/" + f"rapport_entretien-{application_id}.pdf" # concatination du nom du fichier
-    
-	# Étape 4 : Générer le PDF
-
-    generate_pdf(report_content, pdf_path)
+    return upload_folder +"/" + f"rapport_entretien-{application_id}.pdf" # concatination du nom du fichier
 
-    # Étape 5 : Enregistrer le chemin du PDF dans la base de données
 
-    # Mise à jour de la base de données avec le chemin du rapport
+def save_report(application_id, pdf_path, report_hash):
     mongo.db.applications.update_one(
         {"_id": ObjectId(application_id)},
-        {"$set": {"report_path": pdf_path}}
+        {"$set": {"report_path": pdf_path, "report_hash": report_hash, "report_generated_at": datetime.now()}}
     )
 
 
-    return pdf_path
-
+# Rapports de toutes les candidatures d'une offre dont l'entretien est terminé
+# Produit un événement par candidature ({"application_id", "status": generated|skipped|failed}) puis un bilan
+# Une candidature en échec n'interrompt pas le lot
+# Le lot est une tâche (collection tasks) : chaque candidature est réservée via report_task_id avant d'être traitée,
+# celles dont un rapport est déjà en cours (report_queue ou autre lot) sont ignorées
+def generate_job_reports(job_id, force=False):
+    applications = mongo.db.applications.find(
+        {"job_id": ObjectId(job_id), "interview_completed": True}, {"_id": 1}
+    )
+    application_ids = [str(application["_id"]) for application in applications]
+    summary = {"event": "summary", "job_id": job_id, "total": len(application_ids), "generated": 0, "skipped": 0, "failed": 0}
+    yield {"event": "start", "job_id": job_id, "total": len(application_ids)}
+
+    def result(application_id, status, **fields):
+        summary[status] += 1
+        return {"event": "report", "application_id": application_id, "status": status, **fields}
+
+    if not application_ids:
+        yield summary
+        return
+
+    batch_task_id = create_task("report_batch", {"job_id": job_id}, status="running")
+    completed = False
+    # Pool fermé sans attendre dans le finally : si le client se déconnecte, les appels LLM pas encore commencés sont annulés
+    llm_pool = ThreadPoolExecutor(max_workers=REPORT_BATCH_LLM_WORKERS, thread_name_prefix="report-batch")
+    pdf_pool = get_pdf_pool()
+    # future -> (étape, application_id, empreinte)
+    pending = {}
+
+    try:
+        for application_id in application_ids:
+            try:
+                candidate_data = fetch_application_data(application_id)
+            except Exception as e:
+                yield result(application_id, "failed", error=str(e))
+                continue
+            report_hash = compute_report_hash(candidate_data)
+            if not force and report_is_current(candidate_data, report_hash):
+                yield result(application_id, "skipped", report_path=candidate_data["report_path"])
+                continue
+            previous_task_id = candidate_data.get("report_task_id")
+            if task_in_progress(previous_task_id) or not claim_report_task(application_id, previous_task_id, batch_task_id):
+                yield result(application_id, "skipped", reason="report generation already in progress")
+                continue
+            future = llm_pool.submit(generate_report, candidate_data["cv_txt"], candidate_data["conversation"], candidate_data["job"])
+            pending[future] = ("llm", application_id, report_hash)
+
+        # Dès qu'un texte est prêt, son PDF est rendu pendant que les autres appels LLM continuent
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, application_id, report_hash = pending.pop(future)
+                try:
+                    value = future.result()
+                    if stage == "llm":
+                        pdf_path = report_pdf_path(application_id)
+                        pending[pdf_pool.submit(generate_pdf, value, pdf_path)] = ("pdf", application_id, report_hash)
+                        continue
+                    pdf_path = report_pdf_path(application_id)
+                    save_report(application_id, pdf_path, report_hash)
+                    yield result(application_id, "generated", report_path=pdf_path)
+                except Exception as e:
+                    logging.exception(f"Report generation failed for application {application_id}")
+                    yield result(application_id, "failed", stage=stage, error=str(e))
+        completed = True
+    finally:
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        for future in pending:
+            future.cancel() # rendus PDF en attente dans le pool partagé
+        # Lot interrompu (client déconnecté) : la tâche n'est plus "running", les candidatures réservées redeviennent disponibles
+        if completed:
+            update_task(batch_task_id, status="succeeded", result={key: value for key, value in summary.items() if key != "event"})
+        else:
+            update_task(batch_task_id, status="failed", error="Batch interrupted")
+
+    yield summary
+
+
+# Demande de rapport : 200 si le rapport existant est à jour, sinon 202 + task_id à suivre sur /tasks/<task_id>
+# Une demande répétée pendant la génération renvoie la tâche déjà en cours
+def submit_report_generation(application_id):
+    try:
+        candidate_data = fetch_application_data(application_id)
+    except Exception as e:
+        return {"error": str(e)}, 404
+
+    if report_is_current(candidate_data, compute_report_hash(candidate_data)):
+        return {"message": "Report is up to date", "report_path": candidate_data["report_path"]}, 200
+
+    previous_task_id = candidate_data.get("report_task_id")
+    if task_in_progress(previous_task_id):
+        return report_in_progress(previous_task_id)
+
+    # La tâche n'est planifiée que si elle remplace atomiquement report_task_id (deux clics rapprochés : une seule tâche)
+    try:
+        task_id = report_queue.submit(
+            "report", generate_candidate_report, application_id,
+            payload={"application_id": application_id},
+            claim=lambda task_id: claim_report_task(application_id, previous_task_id, task_id)
+        )
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+
+    if task_id is None:
+        application = mongo.db.applications.find_one({"_id": ObjectId(application_id)}, {"report_task_id": 1})
+        return report_in_progress(application.get("report_task_id"))
+    return {"message": "Report generation queued", "task_id": task_id, "status_url": f"/tasks/{task_id}"}, 202
+
+
+def task_in_progress(task_id):
+    if not task_id or not ObjectId.is_valid(task_id):
+        return False
+    task = mongo.db.tasks.find_one({"_id": ObjectId(task_id)}, {"status": 1})
+    return bool(task) and task.get("status") in ("queued", "running")
+
+
+# Remplace report_task_id seulement s'il vaut encore expected_task_id ; False si une autre demande l'a pris
+def claim_report_task(application_id, expected_task_id, task_id):
+    return mongo.db.applications.find_one_and_update(
+        {"_id": ObjectId(application_id), "report_task_id": expected_task_id},
+        {"$set": {"report_task_id": task_id}}
+    ) is not None
+
+
+def report_in_progress(task_id):
+    return {"message": "Report generation already in progress", "task_id": task_id, "status_url": f"/tasks/{task_id}"}, 202
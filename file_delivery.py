@@ -0,0 +1,102 @@
+from flask import Response, request, send_file, abort # fichiers servis avec validateurs et plages d'octets
+from werkzeug.security import safe_join # empêche de sortir du dossier demandé (../)
+from cache import TTLCache # empreintes des fichiers déjà calculées
+import mimetypes
+import hashlib
+import re
+import os
+
+# Si défini (ex. /protected/), l'envoi du fichier est délégué au proxy (nginx) via X-Accel-Redirect :
+# location /protected/ { internal; alias <FILE_ACCEL_ROOT>/; }
+FILE_ACCEL_REDIRECT_PREFIX = os.getenv('FILE_ACCEL_REDIRECT_PREFIX')
+# Dossier servi par cette location du proxy ; seuls les fichiers qu'il contient peuvent être délégués
+FILE_ACCEL_ROOT = os.path.realpath(os.getenv('FILE_ACCEL_ROOT', os.getcwd()))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_READ_SIZE = 1024 * 1024
+
+# Noms générés par l'application (uuid4 hex ou sha256) : le contenu d'un tel fichier ne change jamais
+IMMUTABLE_NAME = re.compile(r"^([0-9a-f]{32}|[0-9a-f]{64})$")
+
+# (chemin, taille, date de modification) -> sha256 : un fichier modifié change de clé
+file_hashes = TTLCache(
+    maxsize=int(os.getenv('FILE_HASH_CACHE_MAXSIZE', 10000)),
+    ttl=int(os.getenv('FILE_HASH_CACHE_TTL', 24 * 3600))
+)
+
+
+def is_immutable_name(path):
+    return bool(IMMUTABLE_NAME.match(os.path.splitext(os.path.basename(path))[0]))
+
+
+# SHA-256 du contenu, lu par blocs ; un fichier nommé par son empreinte n'est pas relu
+def file_sha256(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if len(stem) == 64 and IMMUTABLE_NAME.match(stem):
+        return stem
+
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = file_hashes.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        file_hashes.set(key, digest)
+    return digest
+
+
+def cache_control(immutable, public):
+    scope = "public" if public else "private"
+    if immutable:
+        return f"{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"{scope}, no-cache" # réutilisable après revalidation (304 via ETag)
+
+
+# Envoie un fichier avec ETag fort (empreinte du contenu), If-None-Match/304 et requêtes Range (206)
+# etag : empreinte déjà connue (ex. file_sha256 du CV), sinon calculée ; immutable : nom jamais réutilisé
+def send_stored_file(path, etag=None, immutable=None, public=False, as_attachment=False, download_name=None):
+    if not path or not os.path.isfile(path):
+        abort(404)
+
+    etag = etag or file_sha256(path)
+    if immutable is None:
+        immutable = is_immutable_name(path)
+
+    if FILE_ACCEL_REDIRECT_PREFIX:
+        response = accel_redirect_response(path, etag, as_attachment, download_name)
+    else:
+        response = send_file(
+            path, conditional=True, etag=etag, as_attachment=as_attachment, download_name=download_name
+        )
+    response.headers["Cache-Control"] = cache_control(immutable, public)
+    return response
+
+
+# Le proxy sert le fichier (plages, sendfile) ; l'application ne garde que l'autorisation et les validateurs
+def accel_redirect_response(path, etag, as_attachment, download_name):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # Chemin interne relatif à FILE_ACCEL_ROOT (et non au dossier courant) ; un fichier hors de ce dossier n'est pas servi
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([real_path, FILE_ACCEL_ROOT]) != FILE_ACCEL_ROOT:
+        abort(404)
+    relative_path = os.path.relpath(real_path, FILE_ACCEL_ROOT).replace(os.sep, "/")
+    response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+    response.headers["X-Accel-Redirect"] = FILE_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative_path
+    response.set_etag(etag)
+    if as_attachment:
+        response.headers.set("Content-Disposition", "attachment", filename=download_name or os.path.basename(path))
+    return response
+
+
+# Équivalent de send_from_directory avec les mêmes en-têtes que send_stored_file
+def send_from_folder(folder, filename, **options):
+    path = safe_join(folder, filename) if folder else None
+    if path is None:
+        abort(404)
+    return send_stored_file(path, **options)
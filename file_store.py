@@ -0,0 +1,115 @@
+from pymongo import ReturnDocument
+from datetime import datetime
+from db import mongo
+import hashlib
+import logging
+import uuid
+import os
+
+# Racine du stockage des CVs : uploads/cvs/ab/cd/<sha256>.pdf
+CV_STORAGE_ROOT = os.getenv('CV_STORAGE_ROOT', 'uploads/cvs')
+FILE_STORE_CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+# Deux niveaux de sous-dossiers (256 x 256) : aucun dossier ne contient un nombre de fichiers ingérable
+def sharded_path(root, file_sha256, extension):
+    return os.path.join(root, file_sha256[:2], file_sha256[2:4], f"{file_sha256}{extension}")
+
+
+# Fichiers adressés par leur contenu, comptés par référence dans la collection cv_files
+# Un même fichier envoyé plusieurs fois n'est stocké qu'une fois
+class ContentStore:
+    def __init__(self, root, collection):
+        self.root = root
+        self.collection = collection
+
+    # Écrit le flux sur disque en calculant son SHA-256 au fil de l'eau, puis ajoute une référence
+    # Retourne (sha256, chemin, taille) ; lève FileTooLarge au-delà de max_bytes
+    def store(self, stream, extension, max_bytes=None):
+        tmp_dir = os.path.join(self.root, ".tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(FILE_STORE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise FileTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            file_sha256 = digest.hexdigest()
+            path = sharded_path(self.root, file_sha256, extension)
+            created = self.add_reference(file_sha256, path, size)
+            # Entrée recréée : le fichier présent peut être celui qu'un release() concurrent est en train de supprimer
+            if os.path.exists(path) and not created:
+                os.remove(tmp_path) # contenu déjà stocké
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return file_sha256, path, size
+
+    # Retourne True si l'entrée vient d'être créée (premier exemplaire de ce contenu)
+    def add_reference(self, file_sha256, path, size):
+        now = datetime.now()
+        result = mongo.db[self.collection].update_one(
+            {"_id": file_sha256},
+            {"$inc": {"refs": 1}, "$set": {"updated_at": now}, "$setOnInsert": {"path": path, "size": size, "created_at": now}},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    # Retire une référence ; le fichier n'est supprimé qu'à la disparition de la dernière
+    # Retourne True si le fichier a été supprimé, None si ce contenu n'est pas suivi par le store
+    def release(self, file_sha256):
+        entry = mongo.db[self.collection].find_one_and_update(
+            {"_id": file_sha256},
+            {"$inc": {"refs": -1}, "$set": {"updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not entry:
+            return None
+        if entry.get("refs", 0) > 0:
+            return False
+
+        # Condition refs <= 0 : un nouvel upload du même contenu entre-temps annule la suppression
+        if mongo.db[self.collection].delete_one({"_id": file_sha256, "refs": {"$lte": 0}}).deleted_count:
+            path = entry.get("path")
+            if path and os.path.exists(path):
+                self.remove_file(file_sha256, path)
+            return True
+        return False
+
+    # Le fichier est d'abord renommé, puis supprimé seulement si aucun upload n'a recréé l'entrée entre-temps
+    # (sinon il est remis en place, s'il n'a pas déjà été réécrit par store())
+    def remove_file(self, file_sha256, path):
+        tombstone = f"{path}.{uuid.uuid4().hex}.deleted"
+        try:
+            os.replace(path, tombstone)
+        except OSError as e:
+            logging.warning(f"Failed to remove {path}: {e}")
+            return
+        try:
+            if mongo.db[self.collection].find_one({"_id": file_sha256}, {"_id": 1}) and not os.path.exists(path):
+                os.replace(tombstone, path)
+            else:
+                os.remove(tombstone)
+        except OSError as e:
+            logging.warning(f"Failed to remove {tombstone}: {e}")
+
+
+cv_file_store = ContentStore(CV_STORAGE_ROOT, "cv_files")
@@ -0,0 +1,123 @@
+from pymongo import ASCENDING, DESCENDING, TEXT
+from bson import ObjectId
+from db import mongo
+from job import JOB_TEXT_INDEX_WEIGHTS
+import logging
+
+# Index requis par collection : (clés, options passées à create_index)
+INDEXES = {
+    "users": [
+        ([("email", ASCENDING)], {"unique": True, "name": "users_email_unique"}),
+    ],
+    "cvs": [
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {"name": "cvs_user_id"}),
+        ([("visibility", ASCENDING)], {"name": "cvs_visibility"}),
+    ],
+    "job_offers": [
+        ([(field, TEXT) for field in JOB_TEXT_INDEX_WEIGHTS], {
+            "weights": JOB_TEXT_INDEX_WEIGHTS,
+            "default_language": "none", # offres en français et en anglais : pas de stemming
+            "name": "job_offers_text"
+        }),
+        # Index couvrant le tri (published_on, _id) des pages par curseur
+        ([("visibility", ASCENDING), ("published_on", DESCENDING), ("_id", DESCENDING)], {"name": "job_offers_public_feed"}),
+        ([("created_by", ASCENDING), ("published_on", DESCENDING), ("_id", DESCENDING)], {"name": "job_offers_by_user_feed"}),
+    ],
+    "tasks": [
+        # Les tâches terminées sont purgées après 7 jours
+        ([("updated_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600, "name": "tasks_ttl"}),
+        # Battement des tâches en cours de chaque processus (tasks.heartbeat_loop)
+        ([("worker", ASCENDING), ("status", ASCENDING)], {"name": "tasks_worker_status"}),
+    ],
+    "llm_cache": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "llm_cache_ttl"}),
+        ([("last_used_at", ASCENDING)], {"name": "llm_cache_lru"}),
+    ],
+    "cv_chats": [
+        # Les discussions inactives depuis 30 jours sont supprimées
+        ([("updated_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600, "name": "cv_chats_ttl"}),
+    ],
+    "upload_sessions": [
+        # Les uploads par morceaux abandonnés sont purgés après 24 h
+        ([("updated_at", ASCENDING)], {"expireAfterSeconds": 24 * 3600, "name": "upload_sessions_ttl"}),
+    ],
+    "applications": [
+        ([("application_code", ASCENDING)], {"unique": True, "name": "applications_code_unique"}),
+        # Sert aussi les recherches par candidate_id seul (préfixe)
+        ([("candidate_id", ASCENDING), ("job_id", ASCENDING), ("cv_id", ASCENDING)], {"name": "applications_candidate_job_cv"}),
+        # Candidatures terminées d'une offre (génération des rapports en lot) ; sert aussi les recherches par job_id seul
+        ([("job_id", ASCENDING), ("interview_completed", ASCENDING)], {"name": "applications_job_completed"}),
+    ],
+}
+
+# Formes de requêtes émises par les modules : (collection, filtre, tri)
+# Les valeurs sont des exemples, seul le plan choisi par Mongo compte.
+SAMPLE_ID = ObjectId()
+QUERY_SHAPES = [
+    ("users", {"email": "someone@example.com"}, None),                            # signup, sign_in_user, verify_email_token
+    ("cvs", {"user_id": SAMPLE_ID}, None),                                        # get_all_user_cvs
+    ("cvs", {"visibility": "public"}, None),                                      # get_all_public_cvs, search_public_cvs_logic
+    ("job_offers", {"visibility": "public"}, None),                               # list_all_job_offers
+    ("job_offers", {"visibility": "public"}, [("published_on", -1), ("_id", -1)]), # list_job_offers_page
+    ("job_offers", {"created_by": SAMPLE_ID}, [("published_on", -1), ("_id", -1)]), # get_jobs_by_user
+    ("job_offers", {"$text": {"$search": "python"}}, None),                       # search_job_offers_text
+    ("applications", {"application_code": "1234"}, None),                        # generate_unique_code
+    ("applications", {"candidate_id": SAMPLE_ID, "job_id": SAMPLE_ID, "cv_id": SAMPLE_ID}, None), # apply_to_job
+    ("applications", {"candidate_id": SAMPLE_ID}, None),                          # list_applications_by_candidate
+    ("applications", {"job_id": SAMPLE_ID}, None),                                # list_applications_by_job
+    ("applications", {"job_id": SAMPLE_ID, "interview_completed": True}, None),   # generate_job_reports
+]
+
+
+# Crée les index déclarés (idempotent : create_index ne fait rien si l'index existe déjà)
+# Un index en échec n'empêche pas la création des suivants ; retourne (noms créés, [(nom, erreur)])
+def ensure_indexes():
+    created = []
+    failed = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            name = options.get("name", str(keys))
+            try:
+                created.append(mongo.db[collection].create_index(keys, **options))
+            except Exception as e:
+                logging.error(f"Could not create index {name} on {collection}: {e}")
+                failed.append((name, str(e)))
+    return created, failed
+
+
+# Parcourt un plan d'exécution et retourne tous les noms d'étapes (COLLSCAN, IXSCAN, ...)
+def plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+# Lance explain() sur chaque forme de requête ; lève RuntimeError si l'une fait un COLLSCAN
+def check_query_plans():
+    report = []
+    for collection, query, sort in QUERY_SHAPES:
+        cursor = mongo.db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning_plan)
+        report.append({
+            "collection": collection,
+            "query": repr(query),
+            "sort": repr(sort),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+
+    failures = [entry for entry in report if entry["collscan"]]
+    if failures:
+        details = "\n".join(f"- {entry['collection']} {entry['query']} sort={entry['sort']}" for entry in failures)
+        raise RuntimeError(f"{len(failures)} query shape(s) fall back to COLLSCAN:\n{details}")
+    return report
@@ -1,14 +1,13 @@
 from db import mongo # Connexion à la base de données MongoDB
-from langchain.memory import ConversationBufferMemory # Garder l'historique de la conversation
-from langchain.chains import ConversationChain # Chaîne de conversation LangChain
-from langchain_openai import ChatOpenAI # Intégration de l'API OpenAI avec LangChain
+from job import fetch_job_offer # Lecture de l'offre via le cache
+from langchain.schema import SystemMessage, HumanMessage, AIMessage # Messages de la conversation
+import llm_gateway # Point d'entrée unique des appels au modèle
+from token_budget import fit_text, TOKEN_BUDGET_CV, TOKEN_BUDGET_JOB_TECHNOLOGIES # Textes bornés avant envoi au modèle
 from bson import ObjectId # Manipulation d'identifiants MongoDB
 import logging # Pour le logging des erreurs
-import os # permet d'accéder aux variables d’environnement.
 from dotenv import load_dotenv # Chargement des variables d'environnement
 # Load environment variables from .env
 load_dotenv()
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY') # Récupère la clé API OpenAI depuis le fichier .env
 
 
 #   FONCTION POUR EXTRAIRE LES DONNÉES DE CANDIDATURE
@@ -35,7 +34,7 @@ def fetch_application_data(application_id):
             job_id = ObjectId(job_id)
 
         # Recherche de l'offre d'emploi correspondante
-        job_offer = mongo.db.job_offers.find_one({"_id": job_id})
+        job_offer = fetch_job_offer(job_id)
         if not job_offer:
             print(f"No job found for job_id: {job_id}")
             return None
@@ -46,10 +45,11 @@ def fetch_application_data(application_id):
             job_technologies = ", ".join(job_technologies)
         elif not isinstance(job_technologies, str):
             job_technologies = str(job_technologies)
-        print(cv_txt,job_technologies)
         return {
             "cv_txt": cv_txt,
-            "job_technologies": job_technologies
+            "job_technologies": job_technologies,
+            "conversation": candidate.get("conversation", []),
+            "interview_completed": candidate.get("interview_completed", False)
         }
 
     except Exception as e:
@@ -80,6 +80,9 @@ def append_message(application_id, gpt_msg, user_msg, interview_completed=False)
 #  GÉNÉRER UN MESSAGE SYSTÈME
 def generate_system_message(cv_txt, job_technologies):
     # Génère un prompt structuré pour guider le comportement du chatbot
+    # Le CV et les exigences du poste sont bornés : ce message est renvoyé à chaque tour
+    cv_txt = fit_text(cv_txt, TOKEN_BUDGET_CV, "interview")
+    job_technologies = fit_text(job_technologies, TOKEN_BUDGET_JOB_TECHNOLOGIES, "interview")
     return (
         f"Vous êtes Hajer, responsable du recrutement chez Chosa, et vous menez un entretien téléphonique avec un candidat. "
         f"Sur la base de son CV : {cv_txt}, vous évaluez sa candidature pour un poste correspondant aux exigences suivantes : {job_technologies}. "
@@ -138,53 +141,129 @@ def generate_system_message(cv_txt, job_technologies):
 
 
 
-# INITIALISER LE MODÈLE GPT
-llm = ChatOpenAI(model_name="gpt-4", temperature=0.7)
+# MODÈLE GPT (client mutualisé par llm_gateway)
+INTERVIEW_MODEL = "gpt-4"
+INTERVIEW_TEMPERATURE = 0.7
 
-#  Mémoire temporaire des sessions
-interview_sessions = {}
 
 
-# DÉBUTER L'ENTRETIEN
-def start_interview_process(application_id):
+# Message envoyé au modèle pour lancer l'entretien
+START_PROMPT = "Commencez l'entretien."
+# Formules indiquant que le modèle a clôturé l'entretien
+END_KEYWORDS = [
+    "bye bye", "au revoir", "merci pour cet échange",
+    "l’entretien est terminé", "good bye", "have a good day"
+]
+
+
+def is_interview_completed(gpt_response):
+    return any(kw in gpt_response.lower() for kw in END_KEYWORDS)
+
+
+# UN TOUR D'ENTRETIEN : envoie l'historique + la réponse du candidat, puis mémorise l'échange
+def interview_turn(messages, user_input):
+    response = llm_gateway.invoke(
+        messages + [HumanMessage(content=user_input)],
+        model=INTERVIEW_MODEL, temperature=INTERVIEW_TEMPERATURE, endpoint="interview"
+    ).content
+    messages.append(HumanMessage(content=user_input))
+    messages.append(AIMessage(content=response))
+    return response
+
+
+# UN TOUR D'ENTRETIEN EN FLUX : ("token", texte)... puis ("done", résultat)
+# L'échange n'est mémorisé et enregistré en base qu'une fois la réponse complète
+def interview_turn_events(application_id, messages, user_input, user_msg):
+    parts = []
+    for token in llm_gateway.stream(
+        messages + [HumanMessage(content=user_input)],
+        model=INTERVIEW_MODEL, temperature=INTERVIEW_TEMPERATURE, endpoint="interview"
+    ):
+        parts.append(token)
+        yield "token", token
+
+    gpt_response = "".join(parts)
+    messages.append(HumanMessage(content=user_input))
+    messages.append(AIMessage(content=gpt_response))
+
+    interview_completed = bool(user_msg) and is_interview_completed(gpt_response)
+    append_message(
+        application_id=application_id,
+        gpt_msg=gpt_response,
+        user_msg=user_msg,
+        interview_completed=interview_completed
+    )
+    yield "done", {"question": gpt_response, "end": interview_completed}
+
+
+# PRÉPARER L'ENTRETIEN : vérifications, remise à zéro et message système
+# Retourne (messages, None) ou (None, (erreur, code HTTP))
+def begin_interview(application_id):
     # Fetch application data (CV text and job technologies)
     application_data = fetch_application_data(application_id)
 
     if not application_data:
-        return {"error": "Application data not found"}, 404
+        return None, ({"error": "Application data not found"}, 404)
 
     cv_txt = application_data.get("cv_txt", "")
     job_tech = application_data.get("job_technologies", "")
 
-    application = mongo.db.applications.find_one({"_id": ObjectId(application_id)})
-
     # Vérifie si l'entretien a déjà été réalisé
-    if application and application.get("interview_completed", False):
-        return {"error": "Interview already completed. You cannot start it again."}, 403
+    if application_data.get("interview_completed", False):
+        return None, ({"error": "Interview already completed. You cannot start it again."}, 403)
 
     # Réinitialise la conversation si besoin
-    if application:
-        mongo.db.applications.update_one(
-            {"_id": ObjectId(application_id)},
-            {
-                "$set": {
-                    "conversation": [],
-                    "interview_completed": False
-                }
+    mongo.db.applications.update_one(
+        {"_id": ObjectId(application_id)},
+        {
+            "$set": {
+                "conversation": [],
+                "interview_completed": False
             }
-        )
+        }
+    )
 
-    # Initialize LangChain conversation
+    # Initialize conversation
     system_message = generate_system_message(cv_txt, job_tech)
-    memory = ConversationBufferMemory(return_messages=True)
-    memory.chat_memory.add_message(system_message)
+    return [SystemMessage(content=system_message)], None
+
+
+# REPRENDRE L'ENTRETIEN : l'historique est reconstruit depuis le tableau conversation de la candidature
+# Aucun état en mémoire : n'importe quel worker peut traiter n'importe quel tour
+# Retourne (messages, None) ou (None, (erreur, code HTTP))
+def resume_interview(application_id):
+    if not application_id:
+        return None, ({"error": "Missing application_id"}, 400)
+
+    application_data = fetch_application_data(application_id)
+    if not application_data:
+        return None, ({"error": "Application data not found"}, 404)
+
+    conversation = application_data.get("conversation", [])
+    if not conversation:
+        return None, ({"error": "Interview not started"}, 400)
+    if application_data.get("interview_completed", False):
+        return None, ({"error": "Interview already completed"}, 403)
+
+    system_message = generate_system_message(
+        application_data.get("cv_txt", ""), application_data.get("job_technologies", "")
+    )
+    messages = [SystemMessage(content=system_message)]
+    for entry in conversation:
+        # Le premier tour a été déclenché par START_PROMPT (user vide en base)
+        messages.append(HumanMessage(content=entry.get("user") or START_PROMPT))
+        messages.append(AIMessage(content=entry.get("Gpt", "")))
+    return messages, None
 
-    chain = ConversationChain(llm=llm, memory=memory)
-    session_id = "default"
-    interview_sessions[session_id] = chain
+
+# DÉBUTER L'ENTRETIEN
+def start_interview_process(application_id):
+    messages, error = begin_interview(application_id)
+    if error:
+        return error
 
     # Démarrage de la conversation
-    response = chain.predict(input="Commencez l'entretien.")
+    response = interview_turn(messages, START_PROMPT)
 
     # Save first message to DB
     append_message(
@@ -197,25 +276,25 @@ def start_interview_process(application_id):
     return {"question": response}, 200
 
 
+# DÉBUTER L'ENTRETIEN EN FLUX (SSE) ; retourne (événements, None) ou (None, erreur)
+def start_interview_stream(application_id):
+    messages, error = begin_interview(application_id)
+    if error:
+        return None, error
+    return interview_turn_events(application_id, messages, START_PROMPT, user_msg=""), None
+
+
 # GÉRER LA RÉPONSE DU CANDIDAT
 def handle_answer_process(application_id, user_answer):
-    session_id = "default"
-    
-    if not application_id:
-        return {"error": "Missing application_id"}, 400
-
-    chain = interview_sessions.get(session_id)
-    if not chain:
-        return {"error": "Interview not started"}, 400
+    messages, error = resume_interview(application_id)
+    if error:
+        return error
 
     # Obtenir la réponse GPT
-    gpt_response = chain.predict(input=user_answer)
+    gpt_response = interview_turn(messages, user_answer)
 
     # Vérification si l'entretien est terminé
-    interview_completed = any(kw in gpt_response.lower() for kw in [
-        "bye bye", "au revoir", "merci pour cet échange",
-        "l’entretien est terminé", "good bye", "have a good day"
-    ])
+    interview_completed = is_interview_completed(gpt_response)
 
     # Save conversation to DB
     append_message(
@@ -231,6 +310,15 @@ def handle_answer_process(application_id, user_answer):
     }, 200
 
 
+# GÉRER LA RÉPONSE DU CANDIDAT EN FLUX (SSE) ; retourne (événements, None) ou (None, erreur)
+def handle_answer_stream(application_id, user_answer):
+    messages, error = resume_interview(application_id)
+    if error:
+        return None, error
+
+    return interview_turn_events(application_id, messages, user_answer, user_msg=user_answer), None
+
+
 # RÉCUPÉRER LA CONVERSATION
 def get_conversation_data(application_id):
     try:
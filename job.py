@@ -5,11 +5,53 @@ from bson import ObjectId # Pour convertir les identifiants MongoDB en ObjectId
 import re # Pour les expressions régulières, utilisées dans la recherche
 from scrape import scrape_linkedin_job_details
 from chat import extract_job_info_from_description
+from streaming import wants_ndjson, stream_ndjson
+import os
+import json
+import base64 # Pour encoder les curseurs de pagination
+import copy
+from cache import TTLCache # Cache mémoire LRU/TTL
+from matching import matching_engine
+from tasks import TaskQueue, QueueFull # exécution des scrapes hors du worker web
 
-# Crée une offre d'emploi à partir de données envoyées par l'utilisateur
-def create_job_offers(job_data):
-    job_offer = {
-        "created_by":ObjectId(job_data.get("user")['_id']), # l'id de créateur de l'offre, converti en ObjectId MongoDB
+# Mode de recherche par défaut : "regex" (historique) ou "text" (index texte pondéré)
+JOB_SEARCH_MODE = os.getenv('JOB_SEARCH_MODE', 'regex')
+# Poids de pertinence par champ : title > technologies > skills > company > location
+JOB_TEXT_INDEX_WEIGHTS = {"title": 10, "technologies": 6, "skills": 4, "company": 3, "location": 1}
+
+# Scrapes LinkedIn en arrière-plan : navigateurs simultanés et file d'attente bornés
+scrape_queue = TaskQueue(
+    "scrape",
+    max_workers=int(os.getenv('SCRAPE_WORKERS', 2)),
+    max_pending=int(os.getenv('SCRAPE_MAX_PENDING', 20))
+)
+
+# Caches de lecture : offres par ID et listes/pages publiques
+# Caches propres à chaque processus : une écriture n'invalide que le cache du worker qui l'a faite,
+# les autres workers peuvent servir une offre modifiée, supprimée ou devenue privée jusqu'à l'expiration du TTL,
+# d'où des TTL courts ; apply relit l'offre sans cache
+job_offer_cache = TTLCache(
+    maxsize=int(os.getenv('JOB_CACHE_MAXSIZE', 2048)),
+    ttl=int(os.getenv('JOB_CACHE_TTL', 30))
+)
+job_list_cache = TTLCache(
+    maxsize=int(os.getenv('JOB_LIST_CACHE_MAXSIZE', 256)),
+    ttl=int(os.getenv('JOB_LIST_CACHE_TTL', 15))
+)
+
+# Pagination par curseur des listes d'offres
+JOB_PAGE_DEFAULT_LIMIT = int(os.getenv('JOB_PAGE_DEFAULT_LIMIT', 20))
+JOB_PAGE_MAX_LIMIT = int(os.getenv('JOB_PAGE_MAX_LIMIT', 100))
+# Champs renvoyés pour l'affichage en "carte" dans les listes
+JOB_CARD_PROJECTION = {
+    "title": 1, "company": 1, "location": 1, "technologies": 1, "skills": 1,
+    "level": 1, "published_on": 1, "contract_duration": 1, "visibility": 1, "created_by": 1
+}
+
+# Construit le document job_offers à partir des champs envoyés par le client
+def build_job_offer(job_data, created_by):
+    return {
+        "created_by": ObjectId(created_by), # l'id de créateur de l'offre, converti en ObjectId MongoDB
         "title": job_data.get("title"),
         "company": job_data.get("company"),
         "location": job_data.get("location"),
@@ -21,49 +63,90 @@ def create_job_offers(job_data):
         "salary": job_data.get("salaire"),
         "contract_duration": job_data.get("contract_duration"),
         "start_date": job_data.get("start_date"),
-         "visibility":job_data.get("visibility"),
+        "visibility": job_data.get("visibility"),
     }
 
+
+# Vérifie une offre construite par build_job_offer ; retourne la liste des erreurs
+def validate_job_offer(job_offer):
+    errors = []
+    if not job_offer.get("title"):
+        errors.append("title is required")
+    if job_offer.get("visibility") not in ("public", "private"):
+        errors.append("visibility must be 'public' or 'private'")
+    for field in ("technologies", "skills"):
+        value = job_offer.get(field)
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            errors.append(f"{field} must be a list of strings")
+    return errors
+
+
+# Crée une offre d'emploi à partir de données envoyées par l'utilisateur
+def create_job_offers(job_data):
+    job_offer = build_job_offer(job_data, job_data.get("user")['_id'])
+
     try:
         mongo.db.job_offers.insert_one(job_offer) # Insertion dans la collection job_offers
+        invalidate_job_offer_cache()
         return jsonify({"message": "Job offer created successfully"}), 201
     except Exception as e:
         return jsonify({"message": "Failed to create job offer", "error": str(e)}), 500
 
-# Crée une offre automatiquement à partir d'une URL LinkedIn
+# Scrape + extraction LLM + insertion, exécuté par un worker de scrape_queue
+def import_job_offer_from_linkedin_url(user_id, job_url, visibility, report_progress):
+    if not valid_user_id(user_id):
+        raise ValueError("Invalid user_id") # vérifié avant le scrape, coûteux
+    report_progress("scraping")
+    scraped_data = scrape_linkedin_job_details(job_url)
+    report_progress("extracting")
+    extracted_data=extract_job_info_from_description(scraped_data.get("Full Text"))
+    published_on_str = datetime.now().isoformat()
+    job_offer = {
+        "created_by": ObjectId(user_id),
+        "title": scraped_data.get("Job Title"),
+        "company": scraped_data.get("Company Name"),
+        "location": scraped_data.get("Location"),
+        "technologies": (extracted_data.get("technologies")),
+        "skills": (extracted_data.get("skills")),
+        "published_on": published_on_str,
+        "job_description": extracted_data.get("summary"),
+        "salary": None,
+        "contract_duration": scraped_data.get("Contract Type"),
+        "job_type": scraped_data.get("Job Type"),
+        "Level": scraped_data.get("Level"),
+        "visibility": visibility,
+        "start_date": None
+    }
+
+    report_progress("saving")
+    result = mongo.db.job_offers.insert_one(job_offer)
+    invalidate_job_offer_cache()
+    return {"job_id": str(result.inserted_id)}
+
+def valid_user_id(user_id):
+    return ObjectId.is_valid(user_id) and mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}) is not None
+
+# Crée une offre automatiquement à partir d'une URL LinkedIn : le scrape part en arrière-plan (202 + task_id)
 def create_job_offer_from_linkedin_url(user_id, job_url, visibility):
+    if not valid_user_id(user_id):
+        return {"message": "Failed to create job offer", "error": "Invalid user_id"}, 400
     try:
-        scraped_data = scrape_linkedin_job_details(job_url)
-        extracted_data=extract_job_info_from_description(scraped_data.get("Full Text"))
-        published_on_str = datetime.now().isoformat()
-        job_offer = {
-            "created_by": ObjectId(user_id),
-            "title": scraped_data.get("Job Title"),
-            "company": scraped_data.get("Company Name"),
-            "location": scraped_data.get("Location"),
-            "technologies": (extracted_data.get("technologies")),  
-            "skills": (extracted_data.get("skills")),       
-            "published_on": published_on_str,
-            "job_description": extracted_data.get("summary"),
-            "salary": None,      
-            "contract_duration": scraped_data.get("Contract Type"),
-            "job_type": scraped_data.get("Job Type"),
-            "Level": scraped_data.get("Level"),
-            "visibility": visibility,
-            "start_date": None
-        }
-        # assert isinstance(job_offer["published_on"], str), "published_on is not a string!"
-
-        mongo.db.job_offers.insert_one(job_offer)
-        return {"message": "Job offer created successfully"}, 201
+        task_id = scrape_queue.submit(
+            "linkedin_scrape", import_job_offer_from_linkedin_url, user_id, job_url, visibility,
+            payload={"user_id": user_id, "job_url": job_url}
+        )
+        return {"message": "Job offer import queued", "task_id": task_id, "status_url": f"/tasks/{task_id}"}, 202
 
+    except QueueFull as e:
+        return {"message": "Failed to create job offer", "error": str(e)}, 503
     except Exception as e:
         return {"message": "Failed to create job offer", "error": str(e)}, 500
 
 # Supprime une offre d'emploi selon son ID
 def delete_job_offer_by_id(job_id):
     result = mongo.db.job_offers.delete_one({"_id": ObjectId(job_id)})
-    
+    invalidate_job_offer_cache(job_id)
+
     if result.deleted_count == 1:
         return jsonify({"msg": f"Job offer {job_id} deleted successfully."}), 200
     else:
@@ -72,27 +155,123 @@ def delete_job_offer_by_id(job_id):
 # Convertit l'ObjectId MongoDB en string lisible
 def convert_objectid(job):
     job["_id"] = str(job["_id"])
+    if isinstance(job.get("created_by"), ObjectId):
+        job["created_by"] = str(job["created_by"])
     return job
 
+
+# Encode la position (published_on, _id) de la dernière offre en jeton opaque
+def encode_job_cursor(job):
+    raw = json.dumps([job.get("published_on"), str(job["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# Décode un jeton next_cursor ; lève ValueError s'il est invalide
+def decode_job_cursor(token):
+    try:
+        published_on, job_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return published_on, ObjectId(job_id)
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+
+
+# Page d'offres triée par date de publication (pagination par curseur, sans skip)
+# cache=True : la page est servie depuis job_list_cache (flux public)
+def list_job_offers_page(query, cache=False):
+    limit = max(1, min(request.args.get('limit', JOB_PAGE_DEFAULT_LIMIT, type=int), JOB_PAGE_MAX_LIMIT))
+    token = request.args.get('cursor')
+    view = request.args.get('view', 'card')
+    cache_key = ("page", repr(query), limit, token, view)
+    if cache:
+        page = job_list_cache.get(cache_key)
+        if page is not None:
+            return jsonify(page), 200
+
+    try:
+        if token:
+            published_on, last_id = decode_job_cursor(token)
+            query = {"$and": [query, {"$or": [
+                {"published_on": {"$lt": published_on}},
+                {"published_on": published_on, "_id": {"$lt": last_id}}
+            ]}]}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # view=card (défaut) : projection compacte sans job_description
+    projection = JOB_CARD_PROJECTION if view == 'card' else None
+    jobs_cursor = mongo.db.job_offers.find(query, projection).sort(
+        [("published_on", -1), ("_id", -1)]
+    ).limit(limit + 1)
+    jobs = list(jobs_cursor)
+
+    next_cursor = encode_job_cursor(jobs[limit - 1]) if len(jobs) > limit else None
+    page = {
+        "items": [convert_objectid(job) for job in jobs[:limit]],
+        "next_cursor": next_cursor
+    }
+    if cache:
+        job_list_cache.set(cache_key, page)
+    return jsonify(page), 200
+
+
 # Récupère toutes les offres visibles publiquement
 def list_all_job_offers():
     try:
-        job_offers_cursor = mongo.db.job_offers.find({"visibility": "public"})
-        job_offers = [convert_objectid(job) for job in job_offers_cursor]
+        # Pagination activée dès que le client envoie limit ou cursor
+        if 'limit' in request.args or 'cursor' in request.args:
+            return list_job_offers_page({"visibility": "public"}, cache=True)
+
+        if wants_ndjson():
+            job_offers_cursor = mongo.db.job_offers.find({"visibility": "public"})
+            return stream_ndjson(job_offers_cursor, convert_objectid), 200
+
+        job_offers = job_list_cache.get(("public",))
+        if job_offers is None:
+            job_offers_cursor = mongo.db.job_offers.find({"visibility": "public"})
+            job_offers = [convert_objectid(job) for job in job_offers_cursor]
+            job_list_cache.set(("public",), job_offers)
         return jsonify(job_offers), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+# Lecture d'une offre brute à travers le cache (utilisée aussi par apply, interview et evaluation_report)
+# cached=False : lecture directe dans Mongo, pour les décisions qui ne doivent pas reposer sur une offre périmée
+def fetch_job_offer(job_id, cached=True):
+    job_id = str(job_id)
+    job_offer = job_offer_cache.get(job_id) if cached else None
+    if job_offer is None:
+        job_offer = mongo.db.job_offers.find_one({"_id": ObjectId(job_id)})
+        if not job_offer:
+            return None
+        job_offer_cache.set(job_id, job_offer)
+    return copy.deepcopy(job_offer) # l'appelant peut modifier sa copie sans toucher au cache
+
+
+# Invalide le cache après une écriture : l'offre concernée et toutes les listes
+def invalidate_job_offer_cache(job_id=None):
+    if job_id is not None:
+        job_offer_cache.pop(str(job_id))
+    job_list_cache.clear()
+    matching_engine.mark_stale()
+
+
+# Statistiques des caches d'offres (pour dimensionner maxsize / ttl)
+def get_job_offer_cache_stats():
+    return {
+        "job_offers": job_offer_cache.stats(),
+        "job_lists": job_list_cache.stats()
+    }
+
+
 # Récupère une offre précise par ID
 def get_job_offer_by_id(job_id):
     try:
-        job_offer = mongo.db.job_offers.find_one({"_id": ObjectId(job_id)})
+        job_offer = fetch_job_offer(job_id)
         
         if not job_offer:
             return jsonify({"error": "Job offer not found"}), 404
 
-        job_offer["_id"] = str(job_offer["_id"])  # Convert ObjectId to string
-        return jsonify(job_offer), 200
+        return jsonify(convert_objectid(job_offer)), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -109,6 +288,7 @@ def update_job_offer_by_id(job_id, update_data):
             {"$set": update_data}
         )
 
+        invalidate_job_offer_cache(job_id)
         if result.matched_count == 0:
             return jsonify({"error": "Job offer not found"}), 404
 
@@ -122,13 +302,42 @@ def update_job_offer_by_id(job_id, update_data):
 def get_jobs_by_user(user_id):
     try:
         user_object_id = ObjectId(user_id)
+        if 'limit' in request.args or 'cursor' in request.args:
+            return list_job_offers_page({"created_by": user_object_id})
+
         jobs_cursor = mongo.db.job_offers.find({"created_by": user_object_id})
+        if wants_ndjson():
+            return stream_ndjson(jobs_cursor, convert_objectid), 200
         jobs = [convert_objectid(job) for job in jobs_cursor]
         return jsonify(jobs), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Lit les paramètres de pagination limit/offset de la requête
+def parse_limit_offset(default_limit=None, max_limit=200):
+    limit = request.args.get('limit', type=int) or default_limit
+    offset = request.args.get('offset', 0, type=int) or 0
+    if limit is not None:
+        limit = max(1, min(limit, max_limit))
+    return limit, max(0, offset)
+
+
+# Recherche classée par pertinence via l'index texte ($text + textScore)
+def search_job_offers_text(keyword, limit, offset):
+    results = mongo.db.job_offers.find(
+        {"$text": {"$search": keyword}},
+        {"score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"}), ("_id", -1)]).skip(offset).limit(limit + 1)
+
+    job_offers = [convert_objectid(job) for job in results]
+    has_more = len(job_offers) > limit
+    response = jsonify(job_offers[:limit])
+    if has_more:
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return response, 200
+
+
 # Recherche des offres par mot-clé dans plusieurs champs
 def search_job_offers():
     try:
@@ -136,6 +345,12 @@ def search_job_offers():
         if not keyword:
             return jsonify({"error": "No keyword provided"}), 400
 
+        # mode=text (ou JOB_SEARCH_MODE=text) active la recherche indexée et classée
+        mode = request.args.get('mode', JOB_SEARCH_MODE)
+        if mode == "text":
+            limit, offset = parse_limit_offset(default_limit=20)
+            return search_job_offers_text(keyword, limit, offset)
+
         # Case-insensitive search across relevant fields
         query = {
             "$or": [
@@ -148,6 +363,11 @@ def search_job_offers():
         }
 
         results = mongo.db.job_offers.find(query)
+        limit, offset = parse_limit_offset()
+        if limit is not None:
+            results = results.skip(offset).limit(limit)
+        if wants_ndjson():
+            return stream_ndjson(results, convert_objectid), 200
         job_offers = []
         for job in results:
             job["_id"] = str(job["_id"])
@@ -156,4 +376,4 @@ def search_job_offers():
         return jsonify(job_offers), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
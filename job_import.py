@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+from pymongo.errors import BulkWriteError # erreurs par document d'un insert_many non ordonné
+from db import mongo
+from job import build_job_offer, validate_job_offer, invalidate_job_offer_cache
+
+# Taille par défaut des lots envoyés à insert_many
+JOB_IMPORT_BATCH_SIZE = int(os.getenv('JOB_IMPORT_BATCH_SIZE', 500))
+# Taille maximale du corps d'un import en masse (plus grande que MAX_CONTENT_LENGTH, le corps étant lu en flux)
+JOB_IMPORT_MAX_BYTES = int(os.getenv('JOB_IMPORT_MAX_BYTES', 200 * 1024 * 1024))
+# Nombre maximal d'erreurs détaillées renvoyées dans le rapport
+JOB_IMPORT_MAX_ERRORS = int(os.getenv('JOB_IMPORT_MAX_ERRORS', 1000))
+# Colonnes CSV contenant des listes ("python;docker;aws")
+CSV_LIST_FIELDS = ("technologies", "skills")
+
+
+# Lit un flux NDJSON : une offre JSON par ligne -> (numéro de ligne, dict ou erreur)
+# Un flux illisible (encodage) arrête la lecture : l'erreur est la dernière ligne produite
+def iter_ndjson_rows(lines):
+    row_number = 0
+    lines = iter(lines)
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as e:
+            yield row_number + 1, ValueError(f"Unreadable input, import stopped: {e}")
+            return
+        row_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield row_number, ValueError("Each line must be a JSON object")
+            continue
+        yield row_number, row
+
+
+# Lit un flux CSV avec en-tête ; les colonnes de listes sont séparées par ";" ou "|"
+# Une erreur de lecture (CSV mal formé, encodage) arrête la lecture : l'erreur est la dernière ligne produite
+def iter_csv_rows(lines):
+    reader = csv.DictReader(lines)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, ValueError(f"Invalid CSV, import stopped: {e}")
+            return
+        except UnicodeDecodeError as e:
+            yield reader.line_num + 1, ValueError(f"Unreadable input, import stopped: {e}")
+            return
+        # Les cellules vides sont ignorées pour que les valeurs par défaut s'appliquent
+        data = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+        for field in CSV_LIST_FIELDS:
+            if field in data:
+                data[field] = [item.strip() for item in data[field].replace("|", ";").split(";") if item.strip()]
+        yield reader.line_num, data
+
+
+# Insère un lot sans ordre : les documents valides sont écrits même si d'autres échouent
+def insert_batch(batch, report):
+    documents = [document for _, document in batch]
+    try:
+        result = mongo.db.job_offers.insert_many(documents, ordered=False)
+        report["inserted"] += len(result.inserted_ids)
+    except BulkWriteError as e:
+        report["inserted"] += e.details.get("nInserted", 0)
+        for write_error in e.details.get("writeErrors", []):
+            add_error(report, batch[write_error["index"]][0], write_error.get("errmsg", "Write error"))
+
+
+def add_error(report, row_number, message):
+    report["failed"] += 1
+    if len(report["errors"]) < JOB_IMPORT_MAX_ERRORS:
+        report["errors"].append({"row": row_number, "error": message})
+
+
+# Importe des offres en masse pour un utilisateur ; retourne un rapport ligne par ligne
+# Le cache des offres est invalidé même si la lecture échoue en cours de route (lots déjà insérés)
+def import_job_offers(rows, user_id, batch_size=JOB_IMPORT_BATCH_SIZE, visibility=None):
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    batch = []
+
+    try:
+        for row_number, row in rows:
+            if isinstance(row, Exception):
+                add_error(report, row_number, str(row))
+                continue
+            if visibility and not row.get("visibility"):
+                row["visibility"] = visibility
+
+            job_offer = build_job_offer(row, user_id)
+            errors = validate_job_offer(job_offer)
+            if errors:
+                add_error(report, row_number, "; ".join(errors))
+                continue
+
+            batch.append((row_number, job_offer))
+            if len(batch) >= batch_size:
+                insert_batch(batch, report)
+                batch = []
+
+        if batch:
+            insert_batch(batch, report)
+    finally:
+        if report["inserted"]:
+            invalidate_job_offer_cache()
+    return report
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from db import mongo
+import threading
+import hashlib
+import json
+import os
+
+# Durée de validité d'une réponse en cache
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+# Nombre maximal d'entrées ; les moins récemment utilisées sont supprimées au-delà
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 20000))
+# La taille n'est vérifiée qu'une écriture sur N (count() n'est pas gratuit)
+LLM_CACHE_EVICT_EVERY = 100
+
+
+# Deux textes qui ne diffèrent que par les espaces donnent la même clé
+def normalize_text(text):
+    return " ".join((text or "").split())
+
+
+# Clé adressée par le contenu : sha256(type d'appel, texte normalisé, version du prompt, modèle, température)
+def make_cache_key(namespace, text, prompt_version, model, temperature):
+    raw = json.dumps([namespace, normalize_text(text), prompt_version, model, temperature], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Cache persistant des réponses LLM dans la collection llm_cache (partagé par tous les workers)
+class LLMCache:
+    def __init__(self, ttl_seconds=LLM_CACHE_TTL_SECONDS, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = datetime.now()
+        entry = mongo.db.llm_cache.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_used_at": now}},
+            projection={"value": 1}
+        )
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry["value"] if entry else None
+
+    def set(self, key, namespace, value):
+        now = datetime.now()
+        mongo.db.llm_cache.replace_one({"_id": key}, {
+            "namespace": namespace,
+            "value": value,
+            "created_at": now,
+            "last_used_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds)
+        }, upsert=True)
+        with self._lock:
+            self._writes += 1
+            check_size = self._writes % LLM_CACHE_EVICT_EVERY == 0
+        if check_size:
+            self.evict()
+
+    # Supprime les entrées les moins récemment utilisées au-delà de max_entries
+    def evict(self):
+        overflow = mongo.db.llm_cache.estimated_document_count() - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = mongo.db.llm_cache.find({}, {"_id": 1}).sort("last_used_at", 1).limit(overflow)
+        mongo.db.llm_cache.delete_many({"_id": {"$in": [entry["_id"] for entry in oldest]}})
+
+    # Retourne la réponse en cache ou appelle compute() puis la mémorise
+    # should_cache permet de ne pas garder les réponses en erreur
+    def cached(self, namespace, text, prompt_version, model, temperature, compute, should_cache=lambda value: True):
+        key = make_cache_key(namespace, text, prompt_version, model, temperature)
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if should_cache(value):
+            self.set(key, namespace, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,209 @@
+from langchain_openai import ChatOpenAI # Intégration de l'API OpenAI avec LangChain
+from collections import defaultdict, deque
+from dotenv import load_dotenv
+import threading
+import logging
+import random
+import openai # exceptions de l'API (429, timeouts...)
+from token_budget import count_tokens # tokenizer local (ou estimation)
+import time
+import os
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Autre serveur compatible OpenAI (ex. llm_stub.py pour les tests de charge : http://127.0.0.1:8001/v1)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+
+# Appels simultanés maximum vers le fournisseur, tous modules confondus
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+# Limites de débit (seaux à jetons) : requêtes et tokens par minute
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 300))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 150000))
+# Nouvelles tentatives avec attente exponentielle aléatoire
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_BACKOFF_BASE_SECONDS', 1.0))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', 30.0))
+
+# Erreurs temporaires qui justifient une nouvelle tentative
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+# Seau à jetons : rate jetons rechargés par minute, capacité = une minute de débit
+class TokenBucket:
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Bloque jusqu'à ce que amount jetons soient disponibles
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Tokens d'entrée d'un appel, utilisés pour le seau de tokens
+def estimate_message_tokens(messages):
+    return sum(count_tokens(str(getattr(message, "content", message))) for message in messages) + 1
+
+
+# Métriques par point d'appel : latence, tokens, erreurs
+class LLMMetrics:
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._calls = defaultdict(lambda: {
+            "calls": 0, "errors": 0, "retries": 0,
+            "input_tokens": 0, "output_tokens": 0,
+            "latencies": deque(maxlen=window),
+            "first_token_latencies": deque(maxlen=window)
+        })
+
+    # Délai avant le premier token d'une réponse en flux
+    def record_first_token(self, endpoint, latency):
+        with self._lock:
+            self._calls[endpoint]["first_token_latencies"].append(latency)
+
+    def record(self, endpoint, latency=None, usage=None, error=False, retry=False):
+        with self._lock:
+            entry = self._calls[endpoint]
+            if retry:
+                entry["retries"] += 1
+                return
+            entry["calls"] += 1
+            if error:
+                entry["errors"] += 1
+            if latency is not None:
+                entry["latencies"].append(latency)
+            if usage:
+                entry["input_tokens"] += usage.get("input_tokens", 0)
+                entry["output_tokens"] += usage.get("output_tokens", 0)
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._calls.items():
+                result[endpoint] = {
+                    key: value for key, value in entry.items() if not isinstance(value, deque)
+                }
+                for name, key in (("latency", "latencies"), ("first_token", "first_token_latencies")):
+                    values = sorted(entry[key])
+                    if values:
+                        result[endpoint][f"{name}_p50"] = round(values[len(values) // 2], 3)
+                        result[endpoint][f"{name}_p95"] = round(values[min(len(values) - 1, int(len(values) * 0.95))], 3)
+            return result
+
+
+metrics = LLMMetrics()
+request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE)
+concurrency = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Un client par (modèle, température) : connexions HTTP réutilisées d'un appel à l'autre
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_llm(model, temperature=None):
+    key = (model, temperature)
+    with clients_lock:
+        if key not in clients:
+            options = {"model": model, "openai_api_key": OPENAI_API_KEY, "max_retries": 0} # les retries sont gérés ici
+            if temperature is not None:
+                options["temperature"] = temperature
+            if OPENAI_BASE_URL:
+                options["base_url"] = OPENAI_BASE_URL
+            clients[key] = ChatOpenAI(**options)
+        return clients[key]
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+# Point d'entrée unique des appels au modèle : limites de débit, concurrence, retries et métriques
+def invoke(messages, model="gpt-4o-mini", temperature=None, endpoint="default"):
+    llm = get_llm(model, temperature)
+    estimated_tokens = estimate_message_tokens(messages)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        request_bucket.acquire(1)
+        token_bucket.acquire(estimated_tokens)
+        start = time.perf_counter()
+        try:
+            with concurrency:
+                start = time.perf_counter() # l'attente du sémaphore n'est pas comptée dans la latence
+                response = llm.invoke(messages)
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                metrics.record(endpoint, time.perf_counter() - start, error=True)
+                raise
+            metrics.record(endpoint, retry=True)
+            delay = backoff_delay(attempt)
+            logging.warning(f"LLM call for {endpoint} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        except Exception:
+            metrics.record(endpoint, time.perf_counter() - start, error=True)
+            raise
+
+        metrics.record(endpoint, time.perf_counter() - start, getattr(response, "usage_metadata", None))
+        return response
+
+
+# Variante en flux de invoke() : produit le texte au fur et à mesure de la génération
+# Les retries ne sont possibles que tant qu'aucun token n'a été transmis
+def stream(messages, model="gpt-4o-mini", temperature=None, endpoint="default"):
+    llm = get_llm(model, temperature)
+    estimated_tokens = estimate_message_tokens(messages)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        request_bucket.acquire(1)
+        token_bucket.acquire(estimated_tokens)
+        start = time.perf_counter()
+        started = False
+        usage = None
+        try:
+            with concurrency:
+                start = time.perf_counter()
+                for chunk in llm.stream(messages, stream_usage=True):
+                    if not started:
+                        started = True
+                        metrics.record_first_token(endpoint, time.perf_counter() - start)
+                    if getattr(chunk, "usage_metadata", None):
+                        usage = chunk.usage_metadata
+                    if chunk.content:
+                        yield chunk.content
+        except RETRYABLE_ERRORS as e:
+            if started or attempt == LLM_MAX_RETRIES:
+                metrics.record(endpoint, time.perf_counter() - start, error=True)
+                raise
+            metrics.record(endpoint, retry=True)
+            delay = backoff_delay(attempt)
+            logging.warning(f"LLM stream for {endpoint} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        except Exception:
+            metrics.record(endpoint, time.perf_counter() - start, error=True)
+            raise
+
+        metrics.record(endpoint, time.perf_counter() - start, usage)
+        return
+
+
+def get_llm_stats():
+    return metrics.stats()
@@ -0,0 +1,216 @@
+"""Serveur local compatible avec l'API OpenAI chat completions, pour les tests de charge sans quota.
+
+Réponses préparées par type de prompt (analyse de CV, extraction d'offre, entretien, rapport...),
+latence tirée d'une distribution configurable et taux d'erreurs (429/500) injecté.
+
+    python llm_stub.py --port 8001 --latency lognormal:0.8:0.5 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python app.py
+
+Latences : fixed:S | uniform:MIN:MAX | normal:MOYENNE:ECART | lognormal:MEDIANE:SIGMA (secondes).
+--profile accepte un fichier JSON de réglages par type, ex. {"report": {"latency": "normal:6:1.5", "error_rate": 0.05}}.
+"""
+from flask import Flask, request, jsonify, Response, stream_with_context
+from token_budget import count_tokens
+import argparse
+import random
+import math
+import json
+import time
+import uuid
+
+# Type de prompt -> fragment reconnu dans les messages envoyés (voir chat.py, interview.py, evaluation_report.py...)
+PROMPT_MARKERS = [
+    ("cv_profile", "Analyse ce CV"),
+    ("job_extraction", "extract structured information from job descriptions"),
+    ("cv_chat_summary", "Summarize the following conversation"),
+    ("interview", "Vous êtes Hajer"),
+    ("report", "rapport d'entretien"),
+    ("cv_chat", "improve their CVs"),
+]
+
+CANNED_RESPONSES = {
+    "cv_profile": json.dumps({
+        "owner": "Jane Doe",
+        "contact": {"email": "jane.doe@example.com", "phone_number": "+33 6 00 00 00 00"},
+        "technologies": ["python", "flask", "mongodb", "docker"],
+        "skills": ["résolution de problèmes", "travail en équipe"],
+        "experience": [{"company": "Acme", "duration": "2 ans", "position": "Développeuse backend"}],
+        "levels": {"education_level": 80, "experience_level": 60, "skills_level": 70, "language_level": 75},
+        "education": [{"degree": "Master informatique", "institution": "Université de Tunis", "year": "2022"}],
+        "languages": ["Français (Courant)", "Anglais (Avancé)"],
+        "snapshot": "Développeuse backend orientée API et données.",
+        "hashtags": ["#Backend", "#Python"],
+        "certifications": [],
+        "atouts": ["Autonomie", "Rigueur"],
+        "scores": {"skills_match": 72, "experience_level": 60, "education_match": 80, "language_level": 75}
+    }, ensure_ascii=False),
+    "job_extraction": json.dumps({
+        "summary": "Poste de développeur backend Python au sein d'une équipe produit.",
+        "technologies": ["python", "flask", "mongodb"],
+        "skills": ["communication", "autonomie"]
+    }, ensure_ascii=False),
+    "cv_chat_summary": "The candidate asked how to improve the experience section; advice was given on quantifying results.",
+    "interview": "Merci pour votre réponse. Pouvez-vous donner un exemple concret tiré de votre dernière expérience ?",
+    "report": "\n".join([
+        "1. Informations du candidat",
+        "- Nom et Prénom : Jane Doe",
+        "- Poste visé : Développeur backend",
+        "2. Compétences techniques",
+        "- Maîtrise de Python : 75%",
+        "3. Compétences comportementales",
+        "- Communication claire et structurée.",
+        "4. Niveau de langue",
+        "- Français : Courant",
+        "- Anglais : Avancé",
+        "9. Score global : 72%",
+        "10. Décision finale : réussite",
+    ]),
+    "cv_chat": "Consider adding measurable results to each experience, for example the impact of the APIs you built.",
+    "default": "OK.",
+}
+
+
+def detect_prompt_type(messages):
+    text = "\n".join(str(message.get("content", "")) for message in messages)
+    for prompt_type, marker in PROMPT_MARKERS:
+        if marker in text:
+            return prompt_type
+    return "default"
+
+
+# "lognormal:0.8:0.5" -> fonction qui tire une latence en secondes
+def parse_latency(spec):
+    kind, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubSettings:
+    def __init__(self, latency="fixed:0", error_rate=0.0, rate_limit_share=0.5, token_delay=0.0, profile=None):
+        self.default = {"latency": parse_latency(latency), "error_rate": error_rate}
+        self.rate_limit_share = rate_limit_share # part des erreurs renvoyées en 429 (le reste en 500)
+        self.token_delay = token_delay
+        self.by_type = {}
+        for prompt_type, options in (profile or {}).items():
+            self.by_type[prompt_type] = {
+                "latency": parse_latency(options["latency"]) if "latency" in options else self.default["latency"],
+                "error_rate": options.get("error_rate", error_rate)
+            }
+
+    def for_type(self, prompt_type):
+        return self.by_type.get(prompt_type, self.default)
+
+
+def error_response(settings):
+    if random.random() < settings.rate_limit_share:
+        body = {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}}
+        return jsonify(body), 429, {"Retry-After": "1"}
+    body = {"error": {"message": "The server had an error (stub)", "type": "server_error", "code": None}}
+    return jsonify(body), 500
+
+
+def completion_chunk(completion_id, model, delta=None, finish_reason=None, usage=None):
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}]
+    }
+    if usage:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
+def create_app(settings):
+    app = Flask(__name__)
+    stats = {"requests": 0, "errors": 0, "by_type": {}}
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        data = request.get_json(force=True)
+        messages = data.get("messages", [])
+        model = data.get("model", "stub")
+        prompt_type = detect_prompt_type(messages)
+        options = settings.for_type(prompt_type)
+
+        stats["requests"] += 1
+        stats["by_type"][prompt_type] = stats["by_type"].get(prompt_type, 0) + 1
+
+        time.sleep(options["latency"]())
+        if random.random() < options["error_rate"]:
+            stats["errors"] += 1
+            return error_response(settings)
+
+        content = CANNED_RESPONSES.get(prompt_type, CANNED_RESPONSES["default"])
+        prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+        completion_tokens = count_tokens(content)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+
+        if data.get("stream"):
+            include_usage = (data.get("stream_options") or {}).get("include_usage", False)
+
+            def generate():
+                yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""})
+                for word in content.split(" "):
+                    if settings.token_delay:
+                        time.sleep(settings.token_delay)
+                    yield completion_chunk(completion_id, model, {"content": word + " "})
+                yield completion_chunk(completion_id, model, finish_reason="stop")
+                if include_usage:
+                    yield completion_chunk(completion_id, model, usage=usage)
+                yield "data: [DONE]\n\n"
+
+            return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
+        return jsonify({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        }), 200
+
+    @app.route('/v1/models', methods=['GET'])
+    def list_models():
+        return jsonify({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}, {"id": "gpt-4", "object": "model"}]}), 200
+
+    @app.route('/stats', methods=['GET'])
+    def stub_stats():
+        return jsonify(stats), 200
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0", help="latency distribution applied before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/500")
+    parser.add_argument("--rate-limit-share", type=float, default=0.5, help="share of injected errors returned as 429")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="delay between streamed chunks, in seconds")
+    parser.add_argument("--profile", help="JSON file with per prompt type latency/error_rate overrides")
+    args = parser.parse_args()
+
+    profile = None
+    if args.profile:
+        with open(args.profile, encoding="utf-8") as f:
+            profile = json.load(f)
+
+    settings = StubSettings(args.latency, args.error_rate, args.rate_limit_share, args.token_delay, profile)
+    create_app(settings).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+from flask import jsonify
+from bson import ObjectId
+from db import mongo
+from scipy import sparse # matrices creuses CSR compétences x documents
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+# Durée de vie maximale des matrices avant reconstruction (secondes)
+MATCHING_REFRESH_SECONDS = int(os.getenv('MATCHING_REFRESH_SECONDS', 300))
+MATCHING_DEFAULT_K = 20
+MATCHING_MAX_K = 200
+
+
+# Normalise un libellé de compétence ("  Python " -> "python")
+def normalize_skill(skill):
+    return " ".join(str(skill).lower().split())
+
+
+# Compétences d'une offre : technologies + skills
+def job_skills(job):
+    skills = (job.get("technologies") or []) + (job.get("skills") or [])
+    return {normalize_skill(s) for s in skills if isinstance(s, str) and s.strip()}
+
+
+# Compétences d'un CV à partir de l'expertise enregistrée par add_cv
+def cv_skills(cv):
+    expertise = cv.get("expertise") or {}
+    if isinstance(expertise, dict):
+        skills = (expertise.get("technologies") or []) + (expertise.get("skills") or [])
+    elif isinstance(expertise, list):
+        skills = expertise
+    else:
+        skills = []
+    return {normalize_skill(s) for s in skills if isinstance(s, str) and s.strip()}
+
+
+# Normalise chaque ligne (norme L2 = 1) : le produit scalaire devient une similarité cosinus
+def l2_normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+# Instantané immuable : vocabulaire, pondérations IDF et matrices des offres et des CVs
+class SkillIndex:
+    def __init__(self, jobs, cvs):
+        vocabulary = {}
+        for _, skills in jobs + cvs:
+            for skill in skills:
+                vocabulary.setdefault(skill, len(vocabulary))
+        self.vocabulary = vocabulary
+
+        job_matrix = self.binary_matrix([skills for _, skills in jobs])
+        cv_matrix = self.binary_matrix([skills for _, skills in cvs])
+
+        # IDF : une compétence rare pèse plus qu'une compétence présente partout
+        n_docs = len(jobs) + len(cvs)
+        df = np.asarray(job_matrix.sum(axis=0)).ravel() + np.asarray(cv_matrix.sum(axis=0)).ravel()
+        self.idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+
+        self.job_ids = [job_id for job_id, _ in jobs]
+        self.job_skills = [skills for _, skills in jobs]
+        self.job_matrix = l2_normalize(job_matrix @ sparse.diags(self.idf)).tocsr()
+        self.cv_ids = [cv_id for cv_id, _ in cvs]
+        self.cv_skills = [skills for _, skills in cvs]
+        self.cv_matrix = l2_normalize(cv_matrix @ sparse.diags(self.idf)).tocsr()
+
+    def binary_matrix(self, rows):
+        indices, indptr = [], [0]
+        for skills in rows:
+            indices.extend(self.vocabulary[s] for s in skills if s in self.vocabulary)
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(self.vocabulary)))
+
+    # Vecteur requête (1 x V) ; les compétences inconnues du vocabulaire sont ignorées
+    def vectorize(self, skills):
+        return l2_normalize(self.binary_matrix([skills]) @ sparse.diags(self.idf)).tocsr()
+
+    # Score de la requête contre toutes les lignes en une multiplication, puis top-K partiel
+    @staticmethod
+    def top_k(matrix, query, k):
+        if matrix.shape[0] == 0 or query.nnz == 0:
+            return []
+        scores = (matrix @ query.T).toarray().ravel()
+        k = min(k, len(scores))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in ranked if scores[i] > 0]
+
+
+class MatchingEngine:
+    def __init__(self, refresh_seconds=MATCHING_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._index = None
+        self._built_at = 0
+        self._stale = True
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    # Appelé après une écriture sur job_offers ou cvs : reconstruction en arrière-plan à la prochaine requête
+    # (seul ce processus est prévenu, les autres workers attendent refresh_seconds)
+    def mark_stale(self):
+        self._stale = True
+
+    def build(self):
+        jobs = [
+            (job["_id"], job_skills(job))
+            for job in mongo.db.job_offers.find({"visibility": "public"}, {"technologies": 1, "skills": 1})
+        ]
+        cvs = [
+            (cv["_id"], cv_skills(cv))
+            for cv in mongo.db.cvs.find({"visibility": "public"}, {"expertise": 1})
+        ]
+        return SkillIndex(jobs, cvs)
+
+    # Les écritures arrivées pendant la lecture de Mongo remettent _stale : une nouvelle reconstruction suivra
+    def rebuild(self):
+        try:
+            self._stale = False
+            index = self.build()
+            with self._lock:
+                self._index = index
+                self._built_at = time.monotonic()
+        except Exception as e:
+            logging.warning(f"Matching index rebuild failed: {e}")
+            self._stale = True
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    # Première requête : construction immédiate ; ensuite l'ancien index sert pendant la reconstruction
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._stale = False
+                self._index = self.build()
+                self._built_at = time.monotonic()
+            elif (self._stale or time.monotonic() - self._built_at > self.refresh_seconds) and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self.rebuild, name="matching-rebuild", daemon=True).start()
+            return self._index
+
+    def match_cvs_for_job(self, job, k):
+        index = self.index()
+        skills = job_skills(job)
+        return [
+            (index.cv_ids[i], score, sorted(skills & index.cv_skills[i]))
+            for i, score in index.top_k(index.cv_matrix, index.vectorize(skills), k)
+        ]
+
+    def match_jobs_for_cv(self, cv, k):
+        index = self.index()
+        skills = cv_skills(cv)
+        return [
+            (index.job_ids[i], score, sorted(skills & index.job_skills[i]))
+            for i, score in index.top_k(index.job_matrix, index.vectorize(skills), k)
+        ]
+
+
+matching_engine = MatchingEngine()
+
+
+def parse_k(k):
+    return max(1, min(k or MATCHING_DEFAULT_K, MATCHING_MAX_K))
+
+
+# CVs publics les plus proches d'une offre
+def get_matching_cvs_for_job(job_id, k=None):
+    try:
+        job = mongo.db.job_offers.find_one({"_id": ObjectId(job_id)}, {"technologies": 1, "skills": 1})
+        if not job:
+            return jsonify({"error": "Job offer not found"}), 404
+
+        matches = matching_engine.match_cvs_for_job(job, parse_k(k))
+        cvs = {cv["_id"]: cv for cv in mongo.db.cvs.find(
+            {"_id": {"$in": [cv_id for cv_id, _, _ in matches]}, "visibility": "public"}, {"title": 1, "user_id": 1}
+        )}
+        results = [{
+            "cv_id": str(cv_id),
+            "title": cvs[cv_id].get("title"),
+            "user_id": str(cvs[cv_id].get("user_id")),
+            "score": round(score, 4),
+            "matched_skills": matched
+        } for cv_id, score, matched in matches if cv_id in cvs]
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Offres publiques les plus proches d'un CV
+def get_matching_jobs_for_cv(cv_id, k=None):
+    try:
+        cv = mongo.db.cvs.find_one({"_id": ObjectId(cv_id)}, {"expertise": 1})
+        if not cv:
+            return jsonify({"error": "CV not found"}), 404
+
+        matches = matching_engine.match_jobs_for_cv(cv, parse_k(k))
+        jobs = {job["_id"]: job for job in mongo.db.job_offers.find(
+            {"_id": {"$in": [job_id for job_id, _, _ in matches]}, "visibility": "public"}, {"title": 1, "company": 1, "location": 1}
+        )}
+        results = [{
+            "job_id": str(job_id),
+            "title": jobs[job_id].get("title"),
+            "company": jobs[job_id].get("company"),
+            "location": jobs[job_id].get("location"),
+            "score": round(score, 4),
+            "matched_skills": matched
+        } for job_id, score, matched in matches if job_id in jobs]
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from db import mongo
+import multiprocessing
+import threading
+import tempfile
+import hashlib
+import logging
+import atexit
+import fitz # pour faire l'extraction du texte depuis pdf
+import os
+
+# Limites : fichiers plus lourds refusés, pages au-delà de PDF_MAX_PAGES ignorées
+PDF_MAX_BYTES = int(os.getenv('PDF_MAX_BYTES', 20 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 100))
+# À partir de ce nombre de pages, l'extraction est répartie par tranches sur un pool de processus
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 16))
+PDF_PAGES_PER_CHUNK = int(os.getenv('PDF_PAGES_PER_CHUNK', 8))
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+class PDFTooLarge(ValueError):
+    pass
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Pool de processus créé à la première extraction parallèle
+# spawn : pas de fork d'un worker web multithread (verrous, client Mongo) ; les processus importent ce module
+# et, si l'application est lancée avec python app.py, app.py sous le nom __mp_main__ (sans init_app)
+process_pool = None
+process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(process_pool.shutdown, wait=False, cancel_futures=True)
+        return process_pool
+
+
+# source : octets du PDF, ou chemin d'un fichier (processus du pool : rien de volumineux n'est transmis)
+def open_pdf(source):
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+# Texte des pages [start, stop) ; exécuté dans le processus courant ou dans un processus du pool
+def extract_page_range(source, start, stop):
+    with open_pdf(source) as doc:
+        return [doc[number].get_text() for number in range(start, stop)]
+
+
+def page_count(data):
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return doc.page_count
+
+
+# Générateur du texte de chaque page, dans l'ordre, limité à max_pages
+# Les gros documents sont découpés en tranches traitées en parallèle ; les petits restent dans le processus courant
+def iter_page_texts(data, max_pages=PDF_MAX_PAGES, parallel=None):
+    if len(data) > PDF_MAX_BYTES:
+        raise PDFTooLarge(f"PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB")
+
+    pages = min(page_count(data), max_pages)
+    if parallel is None:
+        parallel = pages >= PDF_PARALLEL_MIN_PAGES and PDF_EXTRACT_WORKERS > 1
+
+    if not parallel:
+        for start in range(0, pages, PDF_PAGES_PER_CHUNK):
+            yield from extract_page_range(data, start, min(start + PDF_PAGES_PER_CHUNK, pages))
+        return
+
+    # Le document est écrit une fois dans un fichier temporaire ; chaque tranche ne reçoit que son chemin
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(data)
+        tmp_path = f.name
+
+    futures = []
+    try:
+        pool = get_process_pool()
+        futures = [
+            pool.submit(extract_page_range, tmp_path, start, min(start + PDF_PAGES_PER_CHUNK, pages))
+            for start in range(0, pages, PDF_PAGES_PER_CHUNK)
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                try:
+                    future.exception() # attend les tranches en cours avant de supprimer le fichier
+                except Exception:
+                    pass
+        os.remove(tmp_path)
+
+
+# Texte complet (pages jointes en une fois) et nombre de pages lues
+def pdf_text_from_bytes(data, max_pages=PDF_MAX_PAGES):
+    page_texts = list(iter_page_texts(data, max_pages))
+    return "".join(page_texts), len(page_texts)
+
+
+# Textes extraits des PDF, adressés par le SHA-256 du fichier (collection pdf_texts, partagée par les workers)
+# Un même fichier (réanalyse, nouvel upload) n'est parsé qu'une seule fois
+class PDFTextStore:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, file_sha256):
+        entry = mongo.db.pdf_texts.find_one({"_id": file_sha256}, {"text": 1})
+        self._count(entry is not None)
+        return entry["text"] if entry else None
+
+    # Retourne (sha256, texte) ; le texte vaut None si le PDF est illisible
+    # Lève PDFTooLarge au-delà de PDF_MAX_BYTES
+    def extract(self, data):
+        if len(data) > PDF_MAX_BYTES:
+            raise PDFTooLarge(f"PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB")
+        file_sha256 = sha256_bytes(data)
+        text = self.get(file_sha256)
+        if text is not None:
+            return file_sha256, text
+
+        try:
+            text, pages = pdf_text_from_bytes(data)
+        except Exception as e:
+            logging.warning(f"PDF text extraction failed for {file_sha256}: {e}")
+            return file_sha256, None
+
+        mongo.db.pdf_texts.update_one(
+            {"_id": file_sha256},
+            {"$setOnInsert": {"text": text, "pages": pages, "size": len(data), "created_at": datetime.now()}},
+            upsert=True
+        )
+        return file_sha256, text
+
+    # Fichier déjà enregistré sur disque ; avec son empreinte connue, le fichier n'est lu qu'en cas d'absence
+    def extract_file(self, path, file_sha256=None):
+        if file_sha256:
+            text = self.get(file_sha256)
+            if text is not None:
+                return file_sha256, text
+        with open(path, "rb") as f:
+            return self.extract(f.read())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+pdf_text_store = PDFTextStore()
@@ -0,0 +1,67 @@
+from reportlab.lib.pagesizes import A4 # Format de page pour le PDF
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle # Styles de texte pour PDF
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer # Eléments de base pour créer le PDF
+from reportlab.lib import colors # Couleurs pour PDF
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import atexit
+import os
+
+# Rendu des PDF en lot dans des processus ; spawn : pas de fork du worker web multithread (verrous, client Mongo)
+# Les processus du pool importent ce module (reportlab seulement) et, si l'application est lancée avec python app.py,
+# app.py sous le nom __mp_main__ : ses imports, sans les connexions ni les tâches de démarrage (voir app.init_app)
+REPORT_BATCH_PDF_WORKERS = int(os.getenv('REPORT_BATCH_PDF_WORKERS', os.cpu_count() or 2))
+
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+
+
+# Pool unique pour le processus, créé au premier lot
+def get_pdf_pool():
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            pdf_pool = ProcessPoolExecutor(
+                max_workers=REPORT_BATCH_PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(pdf_pool.shutdown, wait=False, cancel_futures=True)
+        return pdf_pool
+
+
+# Fonction qui génère un fichier PDF à partir du contenu texte
+def generate_pdf(content, filename):
+
+	doc = SimpleDocTemplate(str(filename), pagesize=A4,
+	                        leftMargin=30, rightMargin=30, topMargin=30, bottomMargin=30)
+
+	elements = []
+	styles = getSampleStyleSheet()
+
+	# Style pour le titre du rapport
+	title_style = ParagraphStyle(
+		'TitleStyle', parent=styles['Title'], fontSize=14, spaceAfter=10, alignment=1
+	)
+
+	# Style pour le texte normal
+	normal_style = ParagraphStyle(
+		'NormalStyle', parent=styles['Normal'], fontSize=10, leading=14, spaceAfter=6
+	)
+
+	# Titre du rapport
+	elements.append(Paragraph("📄 **Rapport d’Entretien**", title_style))
+	elements.append(Spacer(1, 10))
+
+	# Ajout de chaque paragraphe du contenu
+	for paragraph in content.split("\n"):
+		if paragraph.strip():
+			elements.append(Paragraph(paragraph, normal_style))
+			elements.append(Spacer(1, 4))
+
+    # Fonction pour ajouter un pied de page avec numéro
+	def footer(canvas, doc):
+		canvas.setFont("Helvetica", 8)
+		canvas.setFillColor(colors.grey)
+		canvas.drawString(30, 20, f"Page {doc.page}/2")  # Max 2 pages
+
+	doc.build(elements, onLaterPages=footer, onFirstPage=footer)
@@ -4,8 +4,15 @@ from selenium.webdriver.common.keys import Keys # permet de simuler des frappes
 from selenium.webdriver.chrome.service import Service # pour configurer le driver Chrome
 from selenium.webdriver.support.ui import WebDriverWait # permet d'attendre que certains éléments soient présents.
 from selenium.webdriver.support import expected_conditions as EC # conditions d’attente, comme attendre la présence d’un élément.
-import time # utilisé pour ajouter des délais.
+from selenium.common.exceptions import TimeoutException # page trop lente : extraction sur ce qui est chargé
 import os # permet d'accéder aux variables d’environnement.
+import json # sauvegarde des cookies de session
+import tempfile
+import logging
+import queue # navigateurs disponibles du pool
+import threading
+import atexit # fermeture des navigateurs à l'arrêt du processus
+from contextlib import contextmanager
 from dotenv import load_dotenv # charge un fichier .env 
 
 from selenium.webdriver.chrome.options import Options # permet de configurer Chrome
@@ -14,6 +21,17 @@ options = Options() # Création d'une instance d'options pour Chrome
 options.add_argument('--headless')  # mode sans interface graphique 
 load_dotenv() # # Charge les variables d’environnement depuis le fichier .env
 
+# Cookies de session LinkedIn partagés entre les navigateurs et les redémarrages
+LINKEDIN_COOKIES_PATH = os.getenv('LINKEDIN_COOKIES_PATH', 'linkedin_cookies.json')
+# Nombre de navigateurs Chrome gardés ouverts (un par worker de scrape)
+SCRAPE_DRIVER_POOL_SIZE = int(os.getenv('SCRAPE_DRIVER_POOL_SIZE', os.getenv('SCRAPE_WORKERS', 2)))
+# Un navigateur est recyclé après N pages pour limiter les fuites mémoire de Chrome
+SCRAPE_DRIVER_MAX_USES = int(os.getenv('SCRAPE_DRIVER_MAX_USES', 50))
+# Attente maximale du chargement de la page d'offre
+PAGE_LOAD_TIMEOUT = 15
+# Marqueurs d'URL indiquant que la session a expiré
+LOGIN_URL_MARKERS = ("/login", "/authwall", "/checkpoint", "/uas/login")
+
 def login_to_linkedin(driver):
     driver.get("https://www.linkedin.com/login") # Va à la page de login LinkedIn
     username = driver.find_element(By.ID, "username") # Trouve le champ email
@@ -25,6 +43,145 @@ def login_to_linkedin(driver):
     password.send_keys(Keys.RETURN) # Appuie sur Entrée
     WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.ID, "global-nav-search"))) # Attend que la barre de recherche soit chargée
     print("Logged in successfully.") # Affiche un message si tout va bien
+    save_session_cookies(driver)
+
+
+# Sauvegarde les cookies après connexion pour les réutiliser
+def save_session_cookies(driver):
+    # Fichier temporaire propre à chaque navigateur : deux sauvegardes simultanées ne se mélangent pas
+    directory = os.path.dirname(os.path.abspath(LINKEDIN_COOKIES_PATH))
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+        json.dump(driver.get_cookies(), f)
+        tmp_path = f.name
+    os.replace(tmp_path, LINKEDIN_COOKIES_PATH)
+
+
+# Restaure les cookies sauvegardés dans un nouveau navigateur (évite une connexion)
+def restore_session_cookies(driver):
+    if not os.path.exists(LINKEDIN_COOKIES_PATH):
+        return False
+    with open(LINKEDIN_COOKIES_PATH) as f:
+        cookies = json.load(f)
+    driver.get("https://www.linkedin.com/robots.txt") # il faut être sur le domaine pour poser ses cookies
+    for cookie in cookies:
+        cookie.pop("sameSite", None)
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            logging.warning(f"Could not restore cookie: {e}")
+    return True
+
+
+def is_login_page(driver):
+    return any(marker in driver.current_url for marker in LOGIN_URL_MARKERS)
+
+
+# Attend que le contenu de l'offre soit présent au lieu d'une pause fixe
+# Passé le délai, l'extraction se fait quand même sur ce qui est chargé (comme avec l'ancienne pause fixe)
+def wait_for_job_page(driver, timeout=PAGE_LOAD_TIMEOUT):
+    try:
+        WebDriverWait(driver, timeout).until(EC.any_of(
+            EC.presence_of_element_located((By.ID, "job-details")),
+            EC.presence_of_element_located((By.CLASS_NAME, "job-details-jobs-unified-top-card__company-name")),
+            EC.url_contains("/login"),
+            EC.url_contains("/authwall")
+        ))
+    except TimeoutException:
+        logging.warning(f"Job page not ready after {timeout}s, extracting what is loaded: {driver.current_url}")
+
+
+# Ouvre l'offre ; ne se reconnecte que si LinkedIn redirige vers la page de connexion
+def open_job_page(driver, job_url):
+    driver.get(job_url)
+    wait_for_job_page(driver)
+    if is_login_page(driver):
+        login_to_linkedin(driver)
+        driver.get(job_url)
+        wait_for_job_page(driver)
+
+
+# Pool de navigateurs Chrome persistants : démarrage et connexion payés une seule fois
+class DriverPool:
+    def __init__(self, size=SCRAPE_DRIVER_POOL_SIZE, max_uses=SCRAPE_DRIVER_MAX_USES, login=True):
+        self.size = size
+        self.max_uses = max_uses
+        self.login = login
+        self._idle = queue.LifoQueue() # le navigateur le plus récent a le plus de chances d'avoir une session valide
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        driver = webdriver.Chrome(options=options) # Démarre Chrome sans interface
+        if self.login:
+            try:
+                restored = restore_session_cookies(driver)
+            except Exception as e:
+                logging.warning(f"Could not restore LinkedIn session: {e}")
+                restored = False
+            if not restored:
+                try:
+                    login_to_linkedin(driver) # Se connecte à LinkedIn
+                except Exception:
+                    driver.quit()
+                    raise
+        self._uses[id(driver)] = 0
+        return driver
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get() # tous les navigateurs sont occupés : on attend qu'un se libère
+
+    def release(self, driver, broken=False):
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        if broken or self._uses[id(driver)] >= self.max_uses:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def _discard(self, driver):
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def driver(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, broken=True) # état du navigateur inconnu après une erreur
+            raise
+        self.release(driver)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+driver_pool = DriverPool()
+atexit.register(driver_pool.close_all)
 
 # Extraction de la société et du titre du poste
 def extract_company_and_title(driver):
@@ -102,14 +259,10 @@ def extract_job_description(driver):
     return job_description, full_text
 
 # === GLOBAL FUNCTION ===
-def scrape_linkedin_job_details(job_url):
-    driver = webdriver.Chrome(options=options) # Démarre Chrome sans interface
-    job_data = {}
-
-    try:
-        login_to_linkedin(driver) # Se connecte à LinkedIn
-        driver.get(job_url) # Ouvre l’URL de l’offre
-        time.sleep(5) # Attend que la page charge
+def scrape_linkedin_job_details(job_url, pool=None):
+    pool = pool or driver_pool
+    with pool.driver() as driver: # navigateur déjà démarré et connecté
+        open_job_page(driver, job_url) # Ouvre l’URL de l’offre et attend son contenu
 
         company, title = extract_company_and_title(driver)
         location = extract_location(driver)
@@ -127,9 +280,6 @@ def scrape_linkedin_job_details(job_url):
             "Full Text": full_text
         }
 
-    finally:
-        driver.quit() # Ferme le navigateur
-
     return job_data
 
 # juste pour tester sans frontend
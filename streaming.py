@@ -0,0 +1,77 @@
+from flask import Response, request, stream_with_context # Réponse HTTP en flux et accès aux en-têtes de la requête
+from bson import ObjectId # Pour sérialiser les identifiants MongoDB
+from datetime import datetime
+import json
+import os
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Nombre de documents lus par aller-retour Mongo et envoyés par morceau
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))
+
+
+# Le client demande-t-il explicitement du NDJSON (Accept: application/x-ndjson) ?
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+# Sérialisation des types Mongo non supportés par json
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+# Diffuse un curseur PyMongo ligne par ligne : la mémoire ne dépend pas du nombre de résultats
+def stream_ndjson(cursor, convert=lambda doc: doc):
+    cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+
+    def generate():
+        lines = []
+        try:
+            for doc in cursor:
+                lines.append(json.dumps(convert(doc), default=json_default, ensure_ascii=False))
+                if len(lines) >= STREAM_BATCH_SIZE:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        finally:
+            cursor.close()
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+# Diffuse des dictionnaires produits par un générateur (progression d'un traitement long), un par ligne
+def stream_ndjson_events(events):
+    def generate():
+        for event in events:
+            yield json.dumps(event, default=json_default, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers={"X-Accel-Buffering": "no"})
+
+
+# Formate un événement Server-Sent Events
+def sse_event(data, event=None):
+    payload = json.dumps(data, default=json_default, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+
+# Transforme des événements ("token", texte) / ("done", résultat) en flux SSE
+def stream_sse(events):
+    def generate():
+        try:
+            for kind, data in events:
+                if kind == "token":
+                    yield sse_event({"token": data})
+                else:
+                    yield sse_event(data, event=kind)
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # pas de mise en tampon par le proxy
+    )
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor # pool de threads borné pour les traitements longs
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import jsonify
+from db import mongo
+import threading
+import logging
+import socket
+import uuid
+import os
+
+# Les tâches en cours d'un processus sont marquées vivantes toutes les TASK_HEARTBEAT_SECONDS ;
+# sans battement depuis TASK_STALE_SECONDS, leur processus est considéré comme arrêté
+TASK_HEARTBEAT_SECONDS = int(os.getenv('TASK_HEARTBEAT_SECONDS', 30))
+TASK_STALE_SECONDS = int(os.getenv('TASK_STALE_SECONDS', 120))
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Met à jour l'état d'une tâche dans la collection tasks (lisible par tous les workers)
+def update_task(task_id, **fields):
+    fields["updated_at"] = datetime.now()
+    mongo.db.tasks.update_one({"_id": ObjectId(task_id)}, {"$set": fields})
+
+
+# Identifiant du processus courant, recalculé après un fork (workers gunicorn avec --preload)
+worker = {"pid": None, "id": None, "heartbeat": None}
+worker_lock = threading.Lock()
+
+
+def worker_id():
+    with worker_lock:
+        if worker["pid"] != os.getpid():
+            worker["pid"] = os.getpid()
+            worker["id"] = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            worker["heartbeat"] = threading.Thread(target=heartbeat_loop, name="task-heartbeat", daemon=True)
+            worker["heartbeat"].start()
+        return worker["id"]
+
+
+def heartbeat_loop():
+    current = worker_id()
+    while True:
+        try:
+            mongo.db.tasks.update_many(
+                {"worker": current, "status": {"$in": ACTIVE_STATUSES}},
+                {"$set": {"heartbeat_at": datetime.now()}}
+            )
+        except Exception as e:
+            logging.warning(f"Task heartbeat failed: {e}")
+        threading.Event().wait(TASK_HEARTBEAT_SECONDS)
+
+
+# Crée le document d'une tâche rattachée au processus courant ; retourne son id
+def create_task(kind, payload=None, status="queued"):
+    now = datetime.now()
+    return str(mongo.db.tasks.insert_one({
+        "kind": kind,
+        "status": status,
+        "progress": None,
+        "payload": payload or {},
+        "result": None,
+        "error": None,
+        "worker": worker_id(),
+        "heartbeat_at": now,
+        "created_at": now,
+        "updated_at": now
+    }).inserted_id)
+
+
+# Au démarrage : les tâches en attente ou en cours dont le processus ne bat plus ne se termineront jamais
+def fail_stale_tasks():
+    limit = datetime.now() - timedelta(seconds=TASK_STALE_SECONDS)
+    result = mongo.db.tasks.update_many(
+        {"status": {"$in": ACTIVE_STATUSES}, "$or": [
+            {"heartbeat_at": {"$lt": limit}},
+            {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": limit}}
+        ]},
+        {"$set": {"status": "failed", "error": "Worker stopped before the task finished", "updated_at": datetime.now()}}
+    )
+    return result.modified_count
+
+
+# File de tâches en arrière-plan : max_workers en parallèle, max_pending en attente au plus
+class TaskQueue:
+    def __init__(self, name, max_workers, max_pending):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    # Enregistre la tâche puis la planifie ; lève QueueFull si la file est pleine
+    # func(*args, report_progress) doit retourner un résultat sérialisable en BSON
+    # claim(task_id) est appelé avant la planification : s'il retourne False, la tâche est abandonnée et submit retourne None
+    def submit(self, kind, func, *args, payload=None, claim=None):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(f"The {self.name} queue is full, retry later")
+
+        try:
+            task_id = create_task(kind, payload)
+            if claim is not None and not claim(task_id):
+                mongo.db.tasks.delete_one({"_id": ObjectId(task_id)})
+                self._slots.release()
+                return None
+            self._executor.submit(self._run, task_id, func, args)
+        except Exception:
+            self._slots.release()
+            raise
+        return task_id
+
+    def _run(self, task_id, func, args):
+        try:
+            update_task(task_id, status="running")
+            result = func(*args, lambda progress: update_task(task_id, progress=progress))
+            update_task(task_id, status="succeeded", result=result)
+        except Exception as e:
+            logging.exception(f"Task {task_id} failed")
+            update_task(task_id, status="failed", error=str(e))
+        finally:
+            self._slots.release()
+
+
+# Statut et résultat d'une tâche
+def get_task_status(task_id):
+    if not ObjectId.is_valid(task_id):
+        return jsonify({"error": "Invalid task id"}), 400
+
+    task = mongo.db.tasks.find_one({"_id": ObjectId(task_id)})
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+
+    return jsonify({
+        "task_id": str(task["_id"]),
+        "kind": task.get("kind"),
+        "status": task.get("status"),
+        "progress": task.get("progress"),
+        "result": task.get("result"),
+        "error": task.get("error"),
+        "created_at": task.get("created_at"),
+        "updated_at": task.get("updated_at")
+    }), 200
@@ -0,0 +1,158 @@
+from collections import defaultdict
+import threading
+import logging
+import os
+
+# Tokenizer local si tiktoken est installé, sinon estimation calibrée en caractères par token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+TOKEN_ENCODING = os.getenv('TOKEN_ENCODING', 'o200k_base') # encodage des modèles gpt-4o
+# ~4 caractères par token pour du texte français/anglais avec les encodages OpenAI
+TOKEN_CHARS_PER_TOKEN = float(os.getenv('TOKEN_CHARS_PER_TOKEN', 4.0))
+
+# Budgets (en tokens) par type d'entrée envoyée au modèle
+TOKEN_BUDGET_CV = int(os.getenv('TOKEN_BUDGET_CV', 3000))
+TOKEN_BUDGET_JOB = int(os.getenv('TOKEN_BUDGET_JOB', 2000))
+TOKEN_BUDGET_JOB_TECHNOLOGIES = int(os.getenv('TOKEN_BUDGET_JOB_TECHNOLOGIES', 300))
+TOKEN_BUDGET_TRANSCRIPT = int(os.getenv('TOKEN_BUDGET_TRANSCRIPT', 4000))
+
+# Part du budget gardée au début du texte lors d'une troncature (le reste vient de la fin)
+TRUNCATE_HEAD_RATIO = 0.7
+TRUNCATE_MARKER = "\n[...]\n"
+# Les lignes répétées plus courtes que ce seuil sont gardées (ex. "Python" dans deux sections)
+DEDUPE_MIN_CHARS = 20
+
+encoding = None
+if tiktoken is not None:
+    try:
+        encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e: # encodage à télécharger indisponible hors ligne
+        logging.warning(f"tiktoken encoding {TOKEN_ENCODING} unavailable ({e}), using estimator")
+
+
+def count_tokens(text):
+    text = text or ""
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / TOKEN_CHARS_PER_TOKEN) + 1 if text else 0
+
+
+# Espaces multiples, lignes vides en série et espaces de fin de ligne (fréquents dans les PDF)
+def normalize_whitespace(text):
+    lines = [" ".join(line.split()) for line in (text or "").splitlines()]
+    result = []
+    for line in lines:
+        if line or (result and result[-1]):
+            result.append(line)
+    return "\n".join(result).strip()
+
+
+# Supprime les lignes déjà vues (en-têtes/pieds de page répétés sur chaque page, mentions légales...)
+def dedupe_lines(text):
+    seen = set()
+    result = []
+    for line in text.split("\n"):
+        key = line.lower()
+        if len(line) >= DEDUPE_MIN_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        result.append(line)
+    return "\n".join(result)
+
+
+# Garde le début et la fin du texte : identité/résumé en tête, formation/langues souvent en fin de CV
+def truncate_middle(text, budget):
+    if count_tokens(text) <= budget:
+        return text
+    budget = max(budget - count_tokens(TRUNCATE_MARKER), 2)
+    head_budget = int(budget * TRUNCATE_HEAD_RATIO)
+    tail_budget = budget - head_budget
+
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_budget])
+        tail = encoding.decode(tokens[-tail_budget:]) if tail_budget else ""
+    else:
+        head = text[:int(head_budget * TOKEN_CHARS_PER_TOKEN)]
+        tail = text[-int(tail_budget * TOKEN_CHARS_PER_TOKEN):] if tail_budget else ""
+    return head + TRUNCATE_MARKER + tail
+
+
+# Tokens économisés par point d'appel
+class BudgetStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = defaultdict(lambda: {"inputs": 0, "truncated": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0})
+
+    def record(self, endpoint, tokens_in, tokens_out, truncated):
+        with self._lock:
+            entry = self._entries[endpoint]
+            entry["inputs"] += 1
+            entry["truncated"] += int(truncated)
+            entry["tokens_in"] += tokens_in
+            entry["tokens_out"] += tokens_out
+            entry["tokens_saved"] += tokens_in - tokens_out
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._entries.items()}
+
+
+budget_stats = BudgetStats()
+
+
+def record_savings(endpoint, original, fitted, truncated):
+    tokens_in = count_tokens(original)
+    tokens_out = count_tokens(fitted)
+    budget_stats.record(endpoint, tokens_in, tokens_out, truncated)
+    if tokens_in > tokens_out:
+        logging.info(f"Token budget {endpoint}: {tokens_in} -> {tokens_out} tokens ({tokens_in - tokens_out} saved)")
+
+
+# Normalise, dédoublonne puis tronque un texte au budget donné
+def fit_text(text, budget, endpoint):
+    original = text or ""
+    cleaned = dedupe_lines(normalize_whitespace(original))
+    fitted = truncate_middle(cleaned, budget)
+    record_savings(endpoint, original, fitted, fitted is not cleaned)
+    return fitted
+
+
+# Transcription d'entretien au format texte ; les échanges les plus récents sont gardés en priorité
+# conversation : [{"user": ..., "Gpt": ...}] (le premier "user" est vide, l'entretien démarre côté recruteur)
+def fit_transcript(conversation, budget, endpoint, user_label="Candidat", assistant_label="Recruteur"):
+    turns = []
+    for entry in conversation or []:
+        lines = []
+        if entry.get("user"):
+            lines.append(f"{user_label}: {normalize_whitespace(entry['user'])}")
+        if entry.get("Gpt"):
+            lines.append(f"{assistant_label}: {normalize_whitespace(entry['Gpt'])}")
+        if lines:
+            turns.append("\n".join(lines))
+    original = "\n".join(turns)
+
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        tokens = count_tokens(turn) + 1
+        if kept and used + tokens > budget:
+            break
+        kept.append(turn)
+        used += tokens
+    kept.reverse()
+
+    omitted = len(turns) - len(kept)
+    if omitted:
+        kept.insert(0, f"[{omitted} échange(s) précédent(s) omis]")
+    fitted = truncate_middle("\n".join(kept), budget)
+    record_savings(endpoint, original, fitted, omitted > 0 or count_tokens(fitted) < used)
+    return fitted
+
+
+def get_budget_stats():
+    return budget_stats.stats()
@@ -11,6 +11,7 @@ import jwt # Pour générer et décoder des JSON Web Tokens (JWT)
 import uuid # Pour générer un identifiant unique
 from werkzeug.utils import secure_filename # Pour sécuriser le nom d’un fichier uploadé
 import random # Pour générer des nombres aléatoires
+from streaming import wants_ndjson, stream_ndjson # Réponses NDJSON en flux
 
 
 # Chargement des variables d'environnement à partir du fichier .env
@@ -259,16 +260,20 @@ def reset_password_logic():
     return jsonify({"message": "Password reset successfully!"}), 200
 
 
+# Prépare un utilisateur pour la réponse JSON (sans le mot de passe)
+def convert_user(user):
+    user["_id"] = str(user["_id"])  # Convert ObjectId to string
+    user.pop("password", None)      # Remove password
+    return user
+
 def get_all_users():
-    users = mongo.db.users.find()
-    
-    # Optionally hide sensitive info like password
-    users_list = []
-    for user in users:
-        user["_id"] = str(user["_id"])  # Convert ObjectId to string
-        user.pop("password", None)      # Remove password
-        users_list.append(user)
+    users = mongo.db.users.find({}, {"password": 0})
+
+    # Accept: application/x-ndjson => réponse diffusée document par document
+    if wants_ndjson():
+        return stream_ndjson(users, convert_user), 200
 
+    users_list = [convert_user(user) for user in users]
     return jsonify(users_list), 200
 
 def get_user_by_id(user_id):
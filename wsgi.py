@@ -0,0 +1,5 @@
+# Point d'entrée WSGI : gunicorn wsgi:app (ou flask --app wsgi run)
+# Les connexions et tâches de démarrage sont faites ici, pas à l'import de app.py
+from app import app, init_app # noqa: F401 (app : objet servi par gunicorn)
+
+init_app()